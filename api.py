@@ -0,0 +1,299 @@
+# api.py
+"""
+API HTTP/JSON sans interface, pour les caisses et les intégrations : même base et même db.py que l'application.
+
+    python api.py --host 127.0.0.1 --port 8502
+
+    GET  /sante
+    GET  /produits?q=<début du nom>&limit=20       recherche (db.search_produits)
+    GET  /produits/<id>
+    GET  /rapport?from=YYYY-MM-DD&to=YYYY-MM-DD    utils.compute_report
+    POST /ventes    {"lignes": [{"produit_id", "quantite", "prix", "date"}], "check_stock": false}
+    POST /achats    {"lignes": [{"produit_id", "quantite", "prix", "date"}]}
+    POST /depenses  {"lignes": [{"type", "montant", "description", "date"}]}
+    POST /tickets   {"lignes": [{"produit_id", "quantite", "prix"}], "date": ..., "check_stock": false}
+    ("date" est optionnelle partout : date du jour par défaut ; quantités entières > 0, montants finis >= 0)
+
+Lectures : un thread par connexion (ThreadingHTTPServer), connexions du pool de db.py et cache partagé.
+Écritures : déposées dans une file et validées par un seul thread écrivain (WriteBatcher), qui regroupe
+toutes les opérations en attente (au plus MAX_BATCH) dans une transaction (db.write_batch) : un seul
+COMMIT pour le groupe et aucune attente sur le verrou d'écriture de SQLite.
+Délai d'écriture dépassé (WRITE_TIMEOUT_S) : 504 avec "enregistree": false si l'opération, encore dans
+la file, a été retirée (à renvoyer), "enregistree": null si sa transaction était lancée (vérifier avant
+de renvoyer).
+"""
+import json
+import math
+import queue
+import threading
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import db
+import utils
+
+MAX_BATCH = 500  # opérations par transaction
+QUEUE_SIZE = 10000  # au-delà, les écritures sont refusées (503) plutôt que d'accumuler du retard
+WRITE_TIMEOUT_S = db.BUSY_TIMEOUT_S + 15  # au-delà de l'attente du verrou : une transaction lancée aboutit
+MAX_BODY = 10 * 1024 * 1024
+
+class EcritureAnnulee(Exception):
+    """Opération retirée de la file avant toute transaction : rien n'a été enregistré."""
+
+class EcritureIncertaine(TimeoutError):
+    """Délai dépassé alors que la transaction de l'opération était en cours : peut-être enregistrée."""
+
+class _Operation:
+    __slots__ = ("kind", "donnees", "check_stock", "fait", "resultat", "erreur", "etat")
+
+    def __init__(self, kind, donnees, check_stock):
+        self.kind, self.donnees, self.check_stock = kind, donnees, check_stock
+        self.fait = threading.Event()
+        self.resultat = self.erreur = None
+        self.etat = "attente"  # -> "en_cours" (prise par le thread écrivain) ou "annulee" (délai dépassé)
+
+class WriteBatcher:
+    """Thread écrivain unique : vide la file à chaque tour et valide le groupe en une transaction."""
+
+    def __init__(self, max_batch=MAX_BATCH):
+        self.max_batch = max_batch
+        self.stats = {"transactions": 0, "operations": 0, "max_groupe": 0, "annulees": 0}
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._lock = threading.Lock()  # protège _Operation.etat
+        self._thread = threading.Thread(target=self._run, name="api-writer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, kind, donnees, check_stock=False):
+        """
+        Bloque jusqu'au COMMIT du groupe ; retourne le résultat ou lève l'erreur de l'opération.
+        Délai dépassé : EcritureAnnulee si l'opération attendait encore dans la file (elle est retirée,
+        le client peut la renvoyer), EcritureIncertaine si sa transaction était lancée.
+        """
+        op = _Operation(kind, donnees, check_stock)
+        self._queue.put_nowait(op)  # queue.Full : surcharge
+        if not op.fait.wait(WRITE_TIMEOUT_S):
+            with self._lock:
+                if op.etat == "attente":
+                    op.etat = "annulee"
+                    self.stats["annulees"] += 1
+                    raise EcritureAnnulee("Écriture non enregistrée (file d'attente trop longue), réessayer.")
+            if not op.fait.wait(WRITE_TIMEOUT_S):  # transaction en cours : elle aboutit ou échoue
+                raise EcritureIncertaine("Écriture peut-être enregistrée : vérifier avant de la renvoyer.")
+        if op.erreur is not None:
+            raise op.erreur
+        return op.resultat
+
+    def _prendre(self, op):
+        """Passe op à l'état en cours ; False si elle a été annulée (délai dépassé dans la file)."""
+        with self._lock:
+            if op.etat == "annulee":
+                return False
+            op.etat = "en_cours"
+            return True
+
+    def _run(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            groupe = [op] if self._prendre(op) else []
+            # Tout ce qui est arrivé pendant le COMMIT précédent part dans la même transaction
+            while len(groupe) < self.max_batch:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    self._queue.put(None)
+                    break
+                if self._prendre(op):
+                    groupe.append(op)
+            if not groupe:
+                continue
+            try:
+                resultats = db.write_batch([(o.kind, o.donnees, o.check_stock) for o in groupe])
+            except Exception as e:  # transaction entière en échec (base verrouillée, disque plein…)
+                resultats = [(None, e)] * len(groupe)
+            self.stats["transactions"] += 1
+            self.stats["operations"] += len(groupe)
+            self.stats["max_groupe"] = max(self.stats["max_groupe"], len(groupe))
+            for o, (resultat, erreur) in zip(groupe, resultats):
+                o.resultat, o.erreur = resultat, erreur
+                o.fait.set()
+
+# ----------------- Validation des corps de requête -----------------
+def _date(valeur):
+    return None if valeur in (None, "") else date.fromisoformat(str(valeur)).isoformat()
+
+def _lignes(corps):
+    lignes = corps.get("lignes")
+    if not isinstance(lignes, list) or not lignes:
+        raise ValueError("Champ 'lignes' : liste non vide attendue.")
+    return lignes
+
+def _quantite(valeur):
+    # Même règle que importer.parse_row : entier strictement positif (3.0 accepté, 3.7 refusé)
+    if isinstance(valeur, bool) or not isinstance(valeur, (int, float)):
+        raise ValueError(f"quantité invalide : {valeur!r}")
+    if not (0 < valeur <= db.MAX_QUANTITE) or valeur != int(valeur):
+        raise ValueError(f"quantité invalide : {valeur!r}")
+    return int(valeur)
+
+def _montant(valeur, nom="prix"):
+    # Nombre fini, positif ou nul (Infinity / NaN sont acceptés par json.loads)
+    if isinstance(valeur, bool) or not isinstance(valeur, (int, float)):
+        raise ValueError(f"{nom} invalide : {valeur!r}")
+    if not math.isfinite(valeur) or not (0 <= valeur <= db.MAX_MONTANT):
+        raise ValueError(f"{nom} invalide : {valeur!r}")
+    return float(valeur)
+
+def _produit_id(valeur):
+    if isinstance(valeur, bool) or not isinstance(valeur, int) or not (0 < valeur < 2 ** 63):
+        raise ValueError(f"produit_id invalide : {valeur!r}")
+    return valeur
+
+def _lignes_mouvements(corps):
+    return [(_produit_id(l["produit_id"]), _quantite(l["quantite"]), _montant(l["prix"]), _date(l.get("date")))
+            for l in _lignes(corps)]
+
+def _lignes_depenses(corps):
+    return [(str(l["type"]), _montant(l["montant"], "montant"), str(l.get("description") or ""),
+             _date(l.get("date")))
+            for l in _lignes(corps)]
+
+def _ticket(corps):
+    return ([(_produit_id(l["produit_id"]), _quantite(l["quantite"]), _montant(l["prix"])) for l in _lignes(corps)],
+            _date(corps.get("date")))
+
+_ECRITURES = {
+    "/ventes": ("ventes", _lignes_mouvements),
+    "/achats": ("achats", _lignes_mouvements),
+    "/depenses": ("depenses", _lignes_depenses),
+    "/tickets": ("ticket", _ticket),
+}
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "GestionAPI/1.0"
+    protocol_version = "HTTP/1.1"  # connexions persistantes (keep-alive)
+    disable_nagle_algorithm = True  # en-têtes et corps partent en deux envois : pas d'attente de l'ACK différé
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _corps(self):
+        taille = int(self.headers.get("Content-Length") or 0)
+        if taille < 0 or taille > MAX_BODY:
+            self.close_connection = True  # corps non lu : la connexion ne peut pas resservir
+            raise ValueError("Content-Length invalide." if taille < 0 else "Corps de requête trop volumineux.")
+        corps = json.loads(self.rfile.read(taille) or b"{}")
+        if not isinstance(corps, dict):
+            raise ValueError("Objet JSON attendu.")
+        return corps
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == "/sante":
+                self._send(200, {"ok": True, "ecrivain": self.server.batcher.stats})
+            elif url.path == "/produits":
+                rows = db.search_produits(params.get("q", ""), min(int(params.get("limit", 20)), 500))
+                self._send(200, [dict(r) for r in rows])
+            elif url.path.startswith("/produits/"):
+                row = db.get_produit_by_id(int(url.path.rsplit("/", 1)[1]))
+                if row is None:
+                    self._send(404, {"erreur": "Produit inconnu."})
+                else:
+                    self._send(200, dict(row))
+            elif url.path == "/rapport":
+                aujourd_hui = date.today().isoformat()
+                debut, fin = _date(params.get("from")) or aujourd_hui, _date(params.get("to")) or aujourd_hui
+                self._send(200, utils.compute_report(debut, fin))
+            else:
+                self._send(404, {"erreur": f"Route inconnue : {url.path}"})
+        except ValueError as e:
+            self._send(400, {"erreur": str(e)})
+
+    def do_POST(self):
+        try:
+            corps = self._corps()  # lu dans tous les cas : la connexion reste utilisable (keep-alive)
+        except ValueError as e:
+            self._send(400, {"erreur": str(e)})
+            return
+        route = _ECRITURES.get(urlsplit(self.path).path)
+        if route is None:
+            self._send(404, {"erreur": f"Route inconnue : {self.path}"})
+            return
+        kind, lire = route
+        try:
+            donnees = lire(corps)
+        except (ValueError, KeyError, TypeError) as e:
+            self._send(400, {"erreur": f"Champ manquant : {e}" if isinstance(e, KeyError) else str(e)})
+            return
+        try:
+            resultat = self.server.batcher.submit(kind, donnees, bool(corps.get("check_stock", False)))
+        except db.StockInsuffisantError as e:
+            self._send(409, {"erreur": str(e), "produit_id": e.produit_id,
+                             "demande": e.demande, "disponible": e.disponible})
+        except (ValueError, TypeError, KeyError, OverflowError) as e:
+            self._send(400, {"erreur": str(e)})
+        except queue.Full:
+            self._send(503, {"erreur": "Trop d'écritures en attente, réessayer."})
+        except EcritureAnnulee as e:
+            self._send(504, {"erreur": str(e), "enregistree": False})
+        except EcritureIncertaine as e:  # ne pas renvoyer telle quelle : risque de double saisie
+            self._send(504, {"erreur": str(e), "enregistree": None})
+        except Exception as e:  # transaction annulée (verrou, disque) : le client peut réessayer
+            self._send(500, {"erreur": repr(e)})
+        else:
+            self._send(201, {"ticket_id": resultat} if kind == "ticket" else {"lignes": resultat})
+
+class ApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # file d'attente TCP (5 par défaut) : toutes les caisses se connectent à l'ouverture
+
+def make_server(host="127.0.0.1", port=8502, verbose=False):
+    """Crée le serveur (sans le démarrer) avec son thread écrivain ; port=0 : port libre."""
+    db.init_db()
+    server = ApiServer((host, port), Handler)
+    server.verbose = verbose
+    server.batcher = WriteBatcher().start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API HTTP/JSON de la gestion de ventes et stocks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--db", default=db.DB_FILE)
+    parser.add_argument("--verbose", action="store_true", help="journal de chaque requête")
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    server = make_server(args.host, args.port, args.verbose)
+    print(f"API sur http://{args.host}:{server.server_address[1]} (base {db.DB_FILE})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.stop()
@@ -0,0 +1,158 @@
+# benchmarks/bench_db.py
+"""
+Banc d'essai des chemins critiques de db.py et utils.py, sans réseau ni dépendance externe.
+
+Crée une base synthétique (graine fixe), chronomètre chaque opération et écrit un rapport JSON :
+débit (ops/s), latences p50 / p95 (ms) et pic mémoire Python (tracemalloc, passe séparée).
+
+    python benchmarks/bench_db.py --db bench.db --ventes 200000 --out bench.json
+
+Par défaut le cache des lectures est vidé avant chaque mesure (coût réel des requêtes) ;
+--cache mesure au contraire les lectures servies par le cache.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import cache  # noqa: E402
+import db  # noqa: E402
+import synthdata  # noqa: E402
+import utils  # noqa: E402
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def measure(fn, iterations, use_cache=False):
+    """Exécute fn() iterations fois ; retourne débit, p50, p95, max et pic mémoire."""
+    latences = []
+    t_total = time.perf_counter()
+    for i in range(iterations):
+        if not use_cache:
+            cache.invalidate()
+        t0 = time.perf_counter()
+        fn(i)
+        latences.append(time.perf_counter() - t0)
+    total = time.perf_counter() - t_total
+
+    # Pic mémoire sur une exécution supplémentaire (tracemalloc fausserait les temps)
+    if not use_cache:
+        cache.invalidate()
+    tracemalloc.start()
+    fn(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latences.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_s": round(iterations / total, 1) if total else None,
+        "p50_ms": round(_percentile(latences, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latences, 0.95) * 1000, 3),
+        "max_ms": round(latences[-1] * 1000, 3) if latences else 0.0,
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+def run(args):
+    if os.path.exists(args.db) and not args.keep:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    db.close_all()
+    db.DB_FILE = args.db
+    db.init_db()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "cache": args.cache,
+        },
+        "benchmarks": {},
+    }
+    bench = results["benchmarks"]
+
+    t0 = time.perf_counter()
+    results["meta"]["dataset"] = synthdata.fill(args.produits, args.ventes, args.achats, args.depenses,
+                                                args.annees, args.seed)
+    fill_s = time.perf_counter() - t0
+    bench["generation"] = {"seconds": round(fill_s, 3),
+                           "rows_per_s": round((args.ventes + args.achats + args.depenses) / fill_s, 1)}
+
+    rng = random.Random(args.seed)
+    ids = [r["id"] for r in db.get_produits()]
+    noms = [r["nom"] for r in db.get_produits()]
+    today = date.today()
+    n = args.iterations
+
+    bench["add_vente"] = measure(
+        lambda i: db.add_vente(rng.choice(ids), rng.randrange(1, 5), 10.0, today.isoformat()), n)
+    bench["add_achat"] = measure(
+        lambda i: db.add_achat(rng.choice(ids), rng.randrange(1, 20), 8.0, today.isoformat()), n)
+    bench["add_or_update_produit"] = measure(
+        lambda i: db.add_or_update_produit(rng.choice(noms), "", rng.randrange(1, 5), 8.0, 0.0), n)
+    bench["get_produits"] = measure(lambda i: db.get_produits(), n, args.cache)
+    bench["get_ventes"] = measure(lambda i: db.get_ventes(limit=500), n, args.cache)
+
+    periodes = {
+        "jour": (today, today),
+        "semaine": (today - timedelta(days=today.weekday()), today),
+        "mois": (today.replace(day=1), today),
+        "annee": (today - timedelta(days=365), today),
+    }
+    for nom, (debut, fin) in periodes.items():
+        bench[f"compute_report_{nom}"] = measure(
+            lambda i, d=debut.isoformat(), f=fin.isoformat(): utils.compute_report(d, f), n, args.cache)
+
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):  # garder la sortie standard pour le JSON
+        db.reset_database(confirm=True)
+    bench["reset_database"] = {"seconds": round(time.perf_counter() - t0, 3)}
+
+    # ru_maxrss est en Ko sous Linux
+    results["meta"]["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    db.close_all()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench.db", help="fichier SQLite (recréé sauf --keep)")
+    parser.add_argument("--keep", action="store_true", help="ne pas supprimer la base existante")
+    parser.add_argument("--produits", type=int, default=1000)
+    parser.add_argument("--ventes", type=int, default=100000)
+    parser.add_argument("--achats", type=int, default=20000)
+    parser.add_argument("--depenses", type=int, default=2000)
+    parser.add_argument("--annees", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cache", action="store_true", help="mesurer les lectures avec le cache actif")
+    parser.add_argument("--out", help="fichier JSON de sortie (défaut : sortie standard)")
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_reporting.py
+"""
+Compare l'ancienne boucle Python de compute_report à reporting.compute_report_df
+sur des ventes synthétiques en mémoire.
+
+    python benchmarks/bench_reporting.py --ventes 1000000 --produits 2000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reporting  # noqa: E402
+
+def _parse_date(s):
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+def loop_report(ventes, produits, depenses, from_date_str, to_date_str):
+    """Référence : l'implémentation d'origine de utils.compute_report (listes de dicts)."""
+    from_d = _parse_date(from_date_str)
+    to_d = _parse_date(to_date_str)
+    ventes_p = [v for v in ventes if from_d <= _parse_date(v["date"]) <= to_d]
+    deps_p = [d for d in depenses if from_d <= _parse_date(d["date"]) <= to_d]
+    ca = 0.0
+    for v in ventes_p:
+        ca += float(v.get("prix_vente_unitaire", 0.0)) * int(v.get("quantite", 0))
+    cout_achat = 0.0
+    for v in ventes_p:
+        prixA = produits.get(v.get("produit_id"), {}).get("prix_achat", 0.0)
+        cout_achat += float(prixA) * int(v.get("quantite", 0))
+    total_dep = sum(float(d.get("montant", 0.0)) for d in deps_p)
+    byprod = defaultdict(lambda: {"produit": "", "qty": 0, "revenu": 0.0})
+    for v in ventes_p:
+        pid = v.get("produit_id")
+        byprod[pid]["produit"] = produits.get(pid, {}).get("nom", "—")
+        byprod[pid]["qty"] += int(v.get("quantite", 0))
+        byprod[pid]["revenu"] += float(v.get("prix_vente_unitaire", 0.0)) * int(v.get("quantite", 0))
+    top_list = sorted(byprod.values(), key=lambda x: x["qty"], reverse=True)
+    ca_by_day = defaultdict(float)
+    for v in ventes_p:
+        ca_by_day[v["date"]] += float(v.get("prix_vente_unitaire", 0.0)) * int(v.get("quantite", 0))
+    return {"ca": ca, "cout_achat": cout_achat, "depenses": total_dep, "profit": ca - cout_achat - total_dep,
+            "top": top_list, "ca_by_day": [{"date": d, "ca": ca_by_day[d]} for d in sorted(ca_by_day)]}
+
+def synthetic(n_ventes, n_produits, n_depenses, seed):
+    rng = np.random.default_rng(seed)
+    produits = pd.DataFrame({
+        "id": np.arange(1, n_produits + 1, dtype=np.int32),
+        "nom": [f"Produit {i}" for i in range(1, n_produits + 1)],
+        "prix_achat": rng.uniform(1, 100, n_produits).round(2),
+    })
+    jours = np.datetime64("2022-01-01") + rng.integers(0, 3 * 365, n_ventes).astype("timedelta64[D]")
+    ventes = pd.DataFrame({
+        "produit_id": rng.integers(1, n_produits + 1, n_ventes).astype(np.int32),
+        "quantite": rng.integers(1, 10, n_ventes).astype(np.int32),
+        "prix_vente_unitaire": rng.uniform(1, 150, n_ventes).round(2),
+        "date": jours,
+    })
+    dep_jours = np.datetime64("2022-01-01") + rng.integers(0, 3 * 365, n_depenses).astype("timedelta64[D]")
+    depenses = pd.DataFrame({"montant": rng.uniform(5, 500, n_depenses).round(2), "date": dep_jours})
+    return ventes, produits, depenses
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ventes", type=int, default=1_000_000)
+    parser.add_argument("--produits", type=int, default=2000)
+    parser.add_argument("--depenses", type=int, default=10000)
+    parser.add_argument("--from-date", default="2023-01-01")
+    parser.add_argument("--to-date", default="2023-12-31")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    ventes, produits, depenses = synthetic(args.ventes, args.produits, args.depenses, args.seed)
+    # Même données au format de l'ancienne implémentation (dicts, dates en texte)
+    ventes_dicts = ventes.assign(date=ventes["date"].dt.strftime("%Y-%m-%d")).to_dict("records")
+    depenses_dicts = depenses.assign(date=depenses["date"].dt.strftime("%Y-%m-%d")).to_dict("records")
+    produits_dict = {p["id"]: p for p in produits.to_dict("records")}
+
+    t_loop, r_loop = timed(lambda: loop_report(ventes_dicts, produits_dict, depenses_dicts,
+                                               args.from_date, args.to_date), args.repeat)
+    t_vec, r_vec = timed(lambda: reporting.compute_report_df(ventes, produits, depenses,
+                                                             args.from_date, args.to_date), args.repeat)
+    assert abs(r_loop["ca"] - r_vec["ca"]) <= 1e-6 * max(1.0, r_loop["ca"])
+    assert abs(r_loop["cout_achat"] - r_vec["cout_achat"]) <= 1e-6 * max(1.0, r_loop["cout_achat"])
+
+    print(f"ventes: {args.ventes}  période: {args.from_date} → {args.to_date}")
+    print(f"boucle Python : {t_loop * 1000:10.1f} ms")
+    print(f"vectorisé     : {t_vec * 1000:10.1f} ms  (x{t_loop / t_vec:.0f})")
+    for freq in ("W", "M"):
+        t, _ = timed(lambda: reporting.compute_report_df(ventes, produits, depenses,
+                                                         args.from_date, args.to_date, freq), args.repeat)
+        print(f"vectorisé {freq}   : {t * 1000:10.1f} ms")
+
+if __name__ == "__main__":
+    main()
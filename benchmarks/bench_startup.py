@@ -0,0 +1,97 @@
+# benchmarks/bench_startup.py
+"""
+Démarrage à froid et coût d'un rerun de l'application Streamlit (main.py), sans navigateur.
+
+Chaque mesure part d'un processus Python neuf (rien en cache, modules non importés) et d'une base
+temporaire vide ; l'application est exécutée par streamlit.testing (AppTest) :
+    imports_ms          : import des modules importés en tête de main.py
+    premier_affichage_ms: premier passage complet du script (page demandée)
+    rerun_p50_ms        : médiane des reruns suivants (interaction sur la même page)
+    modules             : bibliothèques lourdes chargées après le premier passage
+
+    python benchmarks/bench_startup.py --page "Tableau de bord" --reruns 20 --out startup.json
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOURDS = ("pandas", "numpy", "plotly", "pyarrow", "openpyxl")
+
+_IMPORTS = r"""
+import json, sys, time
+sys.path.insert(0, {racine!r})
+t0 = time.perf_counter()
+import streamlit
+t_streamlit = time.perf_counter() - t0
+t0 = time.perf_counter()
+for m in {imports!r}:
+    __import__(m)
+print(json.dumps({{"streamlit_ms": t_streamlit * 1000, "imports_ms": (time.perf_counter() - t0) * 1000}}))
+"""
+
+_AFFICHAGE = r"""
+import json, os, statistics, sys, tempfile, time
+os.chdir(tempfile.mkdtemp())
+sys.path.insert(0, {racine!r})
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join({racine!r}, "main.py"), default_timeout=120)
+t0 = time.perf_counter()
+at.run()
+premier = time.perf_counter() - t0
+if {page!r} != "Tableau de bord":
+    at.sidebar.selectbox[0].select({page!r}).run()
+modules = [m for m in {lourds!r} if m in sys.modules]
+reruns = []
+for _ in range({reruns}):
+    t0 = time.perf_counter()
+    at.run()
+    reruns.append(time.perf_counter() - t0)
+print(json.dumps({{"premier_affichage_ms": premier * 1000,
+                  "rerun_p50_ms": statistics.median(reruns) * 1000 if reruns else None,
+                  "modules": modules, "exceptions": [str(e.value) for e in at.exception]}}))
+"""
+
+def _executer(code):
+    sortie = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+def imports_main():
+    """Modules du projet et bibliothèques importés au niveau module par main.py."""
+    with open(os.path.join(RACINE, "main.py"), encoding="utf-8") as f:
+        arbre = ast.parse(f.read())
+    noms = []
+    for noeud in arbre.body:
+        if isinstance(noeud, ast.Import):
+            noms += [a.name for a in noeud.names]
+        elif isinstance(noeud, ast.ImportFrom) and noeud.module:
+            noms.append(noeud.module)
+    return [n for n in noms if n != "streamlit"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", default="Tableau de bord")
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--repetitions", type=int, default=3, help="processus neufs ; on garde la médiane")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    code_imports = _IMPORTS.format(racine=RACINE, imports=imports_main())
+    code_affichage = _AFFICHAGE.format(racine=RACINE, page=args.page, lourds=LOURDS, reruns=args.reruns)
+    essais = [dict(_executer(code_imports), **_executer(code_affichage)) for _ in range(args.repetitions)]
+    resultat = {"page": args.page, "reruns": args.reruns}
+    for cle in ("streamlit_ms", "imports_ms", "premier_affichage_ms", "rerun_p50_ms"):
+        valeurs = sorted(e[cle] for e in essais if e[cle] is not None)
+        resultat[cle] = round(valeurs[len(valeurs) // 2], 1) if valeurs else None
+    resultat["modules"] = essais[-1]["modules"]
+    resultat["exceptions"] = essais[-1]["exceptions"]
+    print(json.dumps(resultat, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(resultat, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/load_api.py
+"""
+Test de charge de l'API HTTP (api.py) : débit d'écriture soutenu et latences.
+
+Sans --url, démarre l'API dans ce processus sur une base temporaire (port libre) ; avec --url,
+vise une instance déjà lancée (python api.py). Chaque client (une caisse) garde sa connexion
+HTTP ouverte et envoie en boucle des POST /ventes de --lignes lignes pendant --duree secondes,
+avec une lecture GET /produits toutes les --lectures écritures.
+
+    python benchmarks/load_api.py --clients 16 --duree 10 --lignes 1
+    python benchmarks/load_api.py --url http://127.0.0.1:8502 --clients 32
+
+Affiche requêtes/s, ventes/s, latences p50 / p95 / max et les stats du thread écrivain
+(transactions, taille moyenne des groupes) ; --out écrit le tout en JSON.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_db import _percentile  # noqa: E402
+
+def _request(conn, method, path, corps=None):
+    body = None if corps is None else json.dumps(corps)
+    conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+    resp = conn.getresponse()
+    return resp.status, json.loads(resp.read() or b"null")
+
+def client(host, port, seed, fin, produits, args, mesures):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    latences, statuts, n = [], {}, 0
+    while time.perf_counter() < fin:
+        n += 1
+        if args.lectures and n % args.lectures == 0:
+            t0 = time.perf_counter()
+            statut, _ = _request(conn, "GET", "/produits?q=p&limit=20")
+        else:
+            lignes = [{"produit_id": rng.choice(produits), "quantite": rng.randrange(1, 3), "prix": 10.0}
+                      for _ in range(args.lignes)]
+            t0 = time.perf_counter()
+            statut, _ = _request(conn, "POST", "/ventes", {"lignes": lignes, "check_stock": args.guarded})
+            latences.append(time.perf_counter() - t0)
+        statuts[statut] = statuts.get(statut, 0) + 1
+    conn.close()
+    mesures.append((latences, statuts))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="instance existante (sinon API locale sur base temporaire)")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duree", type=float, default=10.0, help="secondes")
+    parser.add_argument("--lignes", type=int, default=1, help="ventes par requête")
+    parser.add_argument("--lectures", type=int, default=10, help="une lecture toutes les N requêtes (0 : aucune)")
+    parser.add_argument("--produits", type=int, default=200)
+    parser.add_argument("--guarded", action="store_true", help="ventes avec contrôle de stock")
+    parser.add_argument("--out", help="fichier JSON de résultats")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        import api
+        import db
+        db.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="load_api_"), "load.db")
+        server = api.make_server(port=0)
+        host, port = server.server_address
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        for i in range(args.produits):
+            db.add_or_update_produit(f"p{i:05d}", f"cat{i % 10}", 10 ** 6, 5.0, 10.0)
+
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    _, produits = _request(conn, "GET", f"/produits?q=p&limit={args.produits}")
+    conn.close()
+    ids = [p["id"] for p in produits] or [1]
+
+    mesures = []
+    fin = time.perf_counter() + args.duree
+    threads = [threading.Thread(target=client, args=(host, port, i, fin, ids, args, mesures))
+               for i in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - t0
+
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    _, sante = _request(conn, "GET", "/sante")
+    conn.close()
+    if server is not None:
+        server.shutdown()
+        server.batcher.stop()
+
+    latences = sorted(l for ls, _ in mesures for l in ls)
+    statuts = {}
+    for _, st in mesures:
+        for k, v in st.items():
+            statuts[str(k)] = statuts.get(str(k), 0) + v
+    ok = statuts.get("201", 0)
+    ecrivain = sante["ecrivain"]
+    resultat = {
+        "clients": args.clients, "duree_s": round(total, 2), "lignes_par_requete": args.lignes,
+        "statuts": statuts,
+        "ecritures_par_s": round(ok / total, 1),
+        "ventes_par_s": round(ok * args.lignes / total, 1),
+        "p50_ms": round(_percentile(latences, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latences, 0.95) * 1000, 2),
+        "max_ms": round(latences[-1] * 1000, 2) if latences else 0.0,
+        "ecrivain": dict(ecrivain, groupe_moyen=round(ecrivain["operations"] / max(ecrivain["transactions"], 1), 1)),
+    }
+    print(json.dumps(resultat, indent=2, ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(resultat, f, indent=2, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# benchmarks/stress_stock.py
+"""
+Test de charge concurrent des mutations de stock.
+
+Plusieurs threads (chacun avec sa propre connexion du pool, comme plusieurs caisses) enregistrent
+en parallèle ventes, achats et réassorts (add_or_update_produit). À la fin, pour chaque produit :
+    stock == stock initial + achats + réassorts - ventes
+    total_vendu == somme des quantités vendues
+Avec --guarded, les ventes passent par check_stock=True et aucun stock ne doit devenir négatif.
+
+    python benchmarks/stress_stock.py --threads 8 --ops 2000 --guarded
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+
+def worker(seed, ops, produits, guarded, reassorts, erreurs, refus):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        pid, nom = rng.choice(produits)
+        action = rng.random()
+        try:
+            if action < 0.6:
+                db.add_vente(pid, rng.randrange(1, 4), 10.0, check_stock=guarded)
+            elif action < 0.9:
+                db.add_achat(pid, rng.randrange(1, 6), rng.uniform(5, 8))
+            else:
+                q = rng.randrange(1, 3)
+                db.add_or_update_produit(nom, "stress", q, 6.0, 0.0)
+                with reassorts["lock"]:
+                    reassorts[pid] = reassorts.get(pid, 0) + q
+        except db.StockInsuffisantError:
+            refus.append(pid)
+        except Exception as e:  # noqa: BLE001 - on veut compter toute erreur (ex. database is locked)
+            erreurs.append(repr(e))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=1000, help="opérations par thread")
+    parser.add_argument("--produits", type=int, default=5, help="peu de produits = beaucoup de contention")
+    parser.add_argument("--stock-initial", type=int, default=20)
+    parser.add_argument("--guarded", action="store_true", help="ventes avec contrôle de stock")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    db.POOL_SIZE = max(db.POOL_SIZE, args.threads)
+    db.DB_FILE = os.path.join(tempfile.mkdtemp(), "stress.db")
+    db.init_db()
+    for i in range(args.produits):
+        db.add_or_update_produit(f"P{i}", "stress", args.stock_initial, 5.0, 10.0)
+    produits = [(r["id"], r["nom"]) for r in db.get_produits()]
+
+    reassorts, erreurs, refus = {"lock": threading.Lock()}, [], []
+    threads = [threading.Thread(target=worker, args=(args.seed + t, args.ops, produits, args.guarded,
+                                                     reassorts, erreurs, refus))
+               for t in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duree = time.perf_counter() - t0
+
+    ok = not erreurs
+    with db._connect() as c:
+        for p in c.execute("""
+            SELECT p.id, p.nom, p.stock, p.total_vendu,
+                   COALESCE((SELECT SUM(quantite) FROM achats WHERE produit_id = p.id), 0) AS achete,
+                   COALESCE((SELECT SUM(quantite) FROM ventes WHERE produit_id = p.id), 0) AS vendu
+            FROM produits p ORDER BY p.id
+        """).fetchall():
+            attendu = args.stock_initial + p["achete"] + reassorts.get(p["id"], 0) - p["vendu"]
+            statut = "OK"
+            if p["stock"] != attendu or p["total_vendu"] != p["vendu"] or (args.guarded and p["stock"] < 0):
+                statut, ok = "ÉCART", False
+            print(f"{p['nom']:>4} stock={p['stock']:>6} attendu={attendu:>6} "
+                  f"vendu={p['vendu']:>6} total_vendu={p['total_vendu']:>6} {statut}")
+
+    total = args.threads * args.ops
+    print(f"{total} opérations en {duree:.2f} s ({total / duree:.0f} ops/s), "
+          f"{len(refus)} ventes refusées, {len(erreurs)} erreurs")
+    for e in erreurs[:5]:
+        print("  ", e)
+    db.close_all()
+    print("RÉSULTAT :", "OK" if ok else "ÉCHEC")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/synthdata.py
+"""
+Générateur reproductible (graine fixe) de produits, ventes, achats et dépenses.
+
+    python benchmarks/synthdata.py --db bench.db --produits 1000 --ventes 200000 --annees 3
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db  # noqa: E402
+
+CATEGORIES = ["alimentation", "boissons", "hygiène", "maison", "papeterie", "électronique"]
+TYPES_DEPENSE = ["transport", "livraison", "autre"]
+
+def _dates(rng, n, debut, nb_jours):
+    for _ in range(n):
+        yield (debut + timedelta(days=rng.randrange(nb_jours))).isoformat()
+
+def fill(n_produits=1000, n_ventes=100000, n_achats=20000, n_depenses=2000, annees=3, seed=42,
+         batch=50000):
+    """
+    Remplit la base courante (db.DB_FILE) : produits insérés en un lot, puis achats, ventes et dépenses
+    via l'API d'écriture par lots (mêmes mises à jour de stock, coûts et résumés qu'en production).
+    """
+    rng = random.Random(seed)
+    fin = date.today()
+    debut = fin - timedelta(days=365 * annees)
+    nb_jours = (fin - debut).days + 1
+
+    prix = [round(rng.uniform(1, 100), 2) for _ in range(n_produits)]
+    with db.transaction() as c:
+        c.executemany(
+            "INSERT INTO produits (nom, categorie, stock, prix_achat, prix_vente_cts) VALUES (?, ?, ?, ?, ?)",
+            ((f"Produit {i:06d}", rng.choice(CATEGORIES), rng.randrange(0, 200), p, db._cts(p * rng.uniform(1.1, 1.8)))
+             for i, p in enumerate(prix, start=1)))
+        premier_id = c.execute("SELECT MIN(id) FROM produits").fetchone()[0] or 1
+
+    def lots(gen):
+        lot = []
+        for row in gen:
+            lot.append(row)
+            if len(lot) >= batch:
+                yield lot
+                lot = []
+        if lot:
+            yield lot
+
+    def lignes(n, marge):
+        for d in _dates(rng, n, debut, nb_jours):
+            i = rng.randrange(n_produits)
+            yield (premier_id + i, rng.randrange(1, 10), round(prix[i] * marge(), 2), d)
+
+    for lot in lots(lignes(n_achats, lambda: rng.uniform(0.9, 1.1))):
+        db.add_achats_bulk(lot)
+    for lot in lots(lignes(n_ventes, lambda: rng.uniform(1.1, 1.8))):
+        db.add_ventes_bulk(lot)
+    depenses = ((rng.choice(TYPES_DEPENSE), round(rng.uniform(5, 500), 2), "", d)
+                for d in _dates(rng, n_depenses, debut, nb_jours))
+    for lot in lots(depenses):
+        db.add_depenses_bulk(lot)
+    return {"produits": n_produits, "ventes": n_ventes, "achats": n_achats, "depenses": n_depenses,
+            "debut": debut.isoformat(), "fin": fin.isoformat()}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench.db")
+    parser.add_argument("--produits", type=int, default=1000)
+    parser.add_argument("--ventes", type=int, default=100000)
+    parser.add_argument("--achats", type=int, default=20000)
+    parser.add_argument("--depenses", type=int, default=2000)
+    parser.add_argument("--annees", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    db.DB_FILE = args.db
+    db.init_db()
+    print(fill(args.produits, args.ventes, args.achats, args.depenses, args.annees, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# cache.py
+"""
+Cache LRU des lectures (db / utils), partagé par toutes les sessions du processus.
+
+Chaque entrée est indexée par (fonction, paramètres). Toute transaction d'écriture validée
+(db.transaction) appelle invalidate() : le compteur de version est incrémenté et le cache vidé,
+les résultats restent donc valides jusqu'à la prochaine écriture.
+Les écritures d'un autre processus (api.py) sont détectées par watch() au plus tard après WATCH_INTERVAL_S ;
+celles de ce processus recalent le jeton surveillé (resync) et ne sont donc jamais prises pour des écritures
+extérieures, même validées sans invalidation (transaction(invalidate=False)).
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+MAX_ENTRIES = 256
+WATCH_INTERVAL_S = 0.5
+
+_lock = threading.Lock()
+_entries = OrderedDict()
+_version = 0
+_stats = {"hits": 0, "misses": 0}
+_watch = {"fn": None, "token": None, "next": 0.0}
+
+def watch(fn):
+    """
+    fn() retourne un jeton qui change quand les données sont modifiées hors de ce processus
+    (db : PRAGMA data_version). Vérifié au plus toutes les WATCH_INTERVAL_S secondes ; s'il change, invalidate().
+    """
+    _watch.update(fn=fn, token=None, next=0.0)
+
+def _check_external(force=False):
+    now = time.monotonic()
+    if _watch["fn"] is None or (now < _watch["next"] and not force):
+        return
+    _watch["next"] = now + WATCH_INTERVAL_S
+    token = _watch["fn"]()
+    if token != _watch["token"]:
+        if _watch["token"] is not None:
+            invalidate()
+        _watch["token"] = token
+
+def resync():
+    """
+    Après un COMMIT de ce processus : le jeton courant devient la référence, l'écriture locale ne déclenche
+    pas d'invalidation au prochain contrôle. À précéder d'un check_external() sous le verrou d'écriture,
+    pour qu'une écriture extérieure antérieure ne soit pas absorbée.
+    """
+    if _watch["fn"] is not None:
+        _watch["token"] = _watch["fn"]()
+
+def check_external():
+    """Contrôle immédiat des écritures extérieures (sans attendre WATCH_INTERVAL_S)."""
+    _check_external(force=True)
+
+def data_version():
+    return _version
+
+def invalidate():
+    """À appeler après chaque écriture validée."""
+    global _version
+    with _lock:
+        _version += 1
+        _entries.clear()
+
+def stats():
+    """Retourne {hits, misses, entries, version, hit_rate}."""
+    with _lock:
+        total = _stats["hits"] + _stats["misses"]
+        return dict(_stats, entries=len(_entries), version=_version,
+                    hit_rate=_stats["hits"] / total if total else 0.0)
+
+def cached(func):
+    """Décorateur : mémorise le résultat tant que la version des données ne change pas."""
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        _check_external()
+        with _lock:
+            if key in _entries:
+                _entries.move_to_end(key)
+                _stats["hits"] += 1
+                return _entries[key]
+            _stats["misses"] += 1
+            version = _version
+        value = func(*args, **kwargs)
+        with _lock:
+            # Une écriture pendant le calcul : le résultat est peut-être déjà périmé, on ne le garde pas
+            if version == _version:
+                _entries[key] = value
+                if len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+        return value
+
+    return wrapper
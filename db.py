@@ -1,57 +1,599 @@
 # db.py
+import json
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import cache
+import perf
 
 DB_FILE = "data.db"
+POOL_SIZE = 8  # connexions gardées ouvertes par fichier de base
+BUSY_TIMEOUT_S = 30  # attente du verrou d'écriture avant "database is locked"
+
+_pools = {}
+_pools_lock = threading.Lock()
 
-def _get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+def _new_conn():
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, timeout=BUSY_TIMEOUT_S, isolation_level=None,
+                           factory=perf.TimedConnection)
     conn.row_factory = sqlite3.Row
+    # WAL : les lectures ne bloquent plus les écritures (plusieurs sessions Streamlit)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16 Mo de cache de pages
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 Mo en lecture mmap
+    conn.execute("PRAGMA temp_store=MEMORY")
+    _attach_archives(conn)
     return conn
 
-def init_db():
-    c = _get_conn()
-    cur = c.cursor()
-    cur.executescript("""
-    CREATE TABLE IF NOT EXISTS produits (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nom TEXT UNIQUE NOT NULL,
-        categorie TEXT DEFAULT '',
-        prix_achat REAL DEFAULT 0,
-        prix_vente REAL DEFAULT 0,
-        stock INTEGER DEFAULT 0,
-        total_vendu INTEGER DEFAULT 0,
-        total_revenu REAL DEFAULT 0
-    );
-
-    CREATE TABLE IF NOT EXISTS ventes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        produit_id INTEGER,
-        quantite INTEGER,
-        prix_vente_unitaire REAL,
-        date TEXT,
-        FOREIGN KEY(produit_id) REFERENCES produits(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS achats (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        produit_id INTEGER,
-        quantite INTEGER,
-        prix_achat_unitaire REAL,
-        date TEXT,
-        FOREIGN KEY(produit_id) REFERENCES produits(id)
-    );
-
-    CREATE TABLE IF NOT EXISTS depenses (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        type TEXT,
-        description TEXT,
-        montant REAL,
-        date TEXT
-    );
+def _get_pool():
+    with _pools_lock:
+        pool = _pools.get(DB_FILE)
+        if pool is None:
+            pool = _pools[DB_FILE] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return pool
+
+@contextmanager
+def _connect():
+    """
+    Emprunte une connexion au pool (ou en ouvre une) et la rend à la sortie.
+    Le pool vit au niveau du module : il survit aux reruns Streamlit.
+    """
+    pool = _get_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _new_conn()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def transaction(invalidate=True):
+    """
+    Transaction d'écriture partagée par toutes les fonctions db.* :
+    BEGIN IMMEDIATE pose le verrou d'écriture dès le début (pas d'échec au passage lecture -> écriture),
+    COMMIT à la sortie, ROLLBACK en cas d'exception. Après COMMIT, le cache des lectures est invalidé
+    (invalidate=False pour les tables qui ne sont lues par aucune fonction en cache).
+    Le jeton de cache.watch est recalé après le COMMIT : seules les écritures des autres processus invalident
+    le cache à distance. Celles validées avant notre verrou sont prises en compte juste après le BEGIN.
+    """
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cache.check_external()  # aucune autre écriture ne peut être validée tant que le verrou est tenu
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        cache.resync()
+    if invalidate:
+        cache.invalidate()
+
+_version_conns = {}  # DB_FILE -> connexion qui ne fait que lire PRAGMA data_version
+_version_lock = threading.Lock()
+
+def _data_version():
+    """
+    Change à chaque COMMIT d'une autre connexion sur la base, y compris depuis un autre processus
+    (api.py et l'application Streamlit partagent data.db) : permet au cache de se vider.
+    """
+    with _version_lock:
+        conn = _version_conns.get(DB_FILE)
+        if conn is None:
+            conn = _version_conns[DB_FILE] = sqlite3.connect(DB_FILE, check_same_thread=False)
+        return DB_FILE, conn.execute("PRAGMA data_version").fetchone()[0]
+
+cache.watch(_data_version)
+
+def close_all():
+    """Ferme toutes les connexions du pool (tests, changement de DB_FILE, arrêt)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    with _version_lock:
+        for conn in _version_conns.values():
+            conn.close()
+        _version_conns.clear()
+    _initialises.clear()
+    cache.invalidate()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+class StockInsuffisantError(ValueError):
+    """Vente refusée : le stock du produit ne couvre pas la quantité demandée."""
+
+    def __init__(self, produit_id, demande, disponible):
+        super().__init__(f"Stock insuffisant pour le produit {produit_id} : "
+                         f"{demande} demandé(s), {disponible} disponible(s).")
+        self.produit_id = produit_id
+        self.demande = demande
+        self.disponible = disponible
+
+def _today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+# ----------------- Stockage compact : centimes et numéros de jour -----------------
+# Depuis la migration 2, les montants sont stockés en centimes entiers (colonnes *_cts) et les dates
+# en numéro de jour (colonne jour : jours depuis le 1970-01-01). Sommes exactes, comparaisons et index
+# sur des entiers. L'interface de db.py ne change pas : montants en dh (float) et dates 'YYYY-MM-DD'
+# en entrée comme en sortie, la conversion est faite ici ou dans les requêtes (_SQL_DATE, / 100.0).
+# produits.prix_achat reste un REAL en dh : c'est un prix moyen pondéré, pas un montant saisi.
+_EPOCH = date(1970, 1, 1).toordinal()
+_SQL_DATE = "date({} * 86400, 'unixepoch')"  # numéro de jour -> 'YYYY-MM-DD'
+
+def _jour(date_str):
+    """'YYYY-MM-DD' -> numéro de jour (ValueError si la date est invalide)."""
+    return date.fromisoformat(date_str).toordinal() - _EPOCH
+
+def _date_str(jour):
+    return None if jour is None else date.fromordinal(jour + _EPOCH).isoformat()
+
+# Bornes des saisies (API, imports) : au-delà, erreur de saisie et dépassement des entiers SQLite sur les cumuls
+MAX_QUANTITE = 10 ** 9
+MAX_MONTANT = 10 ** 9  # dh
+
+def _cts(montant):
+    """Montant en dh -> centimes entiers, arrondi comme CAST(ROUND(x * 100) AS INTEGER) de SQLite."""
+    x = float(montant) * 100
+    return int(x + 0.5) if x >= 0 else -int(0.5 - x)
+
+# ----------------- Schéma et migrations -----------------
+# schema_version garde le numéro des migrations appliquées ; init_db n'exécute que les suivantes,
+# et une seule fois par processus et par fichier : un rerun Streamlit ne touche plus au schéma.
+_initialises = set()  # DB_FILE déjà initialisés par ce processus (vidé par close_all)
+
+def _schema_version(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applique_le TEXT
+        )
     """)
-    c.commit()
-    c.close()
+    return c.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+MIGRATION_LOCK_TIMEOUT_S = 3600  # attente maximale de la migration lancée par un autre processus
+
+@contextmanager
+def _verrou_migration():
+    """
+    Verrou exclusif entre processus pendant les migrations (l'application et api.py peuvent démarrer
+    ensemble sur une ancienne base) : la migration 2 n'est pas transactionnelle et ne doit tourner qu'une
+    fois. Transaction EXCLUSIVE sur un petit fichier SQLite à côté de la base (<base>.migration), libérée
+    à la sortie ou à la mort du processus ; le fichier est conservé.
+    """
+    conn = sqlite3.connect(DB_FILE + ".migration", timeout=MIGRATION_LOCK_TIMEOUT_S, isolation_level=None)
+    try:
+        conn.execute("BEGIN EXCLUSIVE")
+        yield
+    finally:
+        conn.close()  # ROLLBACK : rien n'a été écrit dans le fichier de verrou
+
+def init_db():
+    """Applique dans l'ordre les MIGRATIONS de numéro supérieur à schema_version."""
+    if DB_FILE in _initialises:
+        return
+    with _connect() as c:
+        version = _schema_version(c)
+    if version < MIGRATIONS[-1][0]:
+        with _verrou_migration():
+            with _connect() as c:
+                version = _schema_version(c)  # relu sous le verrou : un autre processus a peut-être migré
+            for numero, description, migration in MIGRATIONS:
+                if numero > version:
+                    migration()
+                    with transaction() as c:
+                        c.execute("INSERT OR IGNORE INTO schema_version (version, description, applique_le) "
+                                  "VALUES (?, ?, ?)",
+                                  (numero, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+    _initialises.add(DB_FILE)
+
+def _migration_schema_initial():
+    """
+    Tables, index et recherche plein texte ; met aussi à niveau les bases créées avant
+    schema_version (colonnes ajoutées, coûts des ventes, résumés journaliers).
+    """
+    with _connect() as c:
+        c.executescript("""
+        CREATE TABLE IF NOT EXISTS produits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT UNIQUE NOT NULL,
+            categorie TEXT DEFAULT '',
+            prix_achat REAL DEFAULT 0,
+            prix_vente REAL DEFAULT 0,
+            stock INTEGER DEFAULT 0,
+            total_vendu INTEGER DEFAULT 0,
+            total_revenu REAL DEFAULT 0,
+            seuil_alerte INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS ventes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produit_id INTEGER,
+            quantite INTEGER,
+            prix_vente_unitaire REAL,
+            date TEXT,
+            cout_unitaire REAL,
+            FOREIGN KEY(produit_id) REFERENCES produits(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS achats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            produit_id INTEGER,
+            quantite INTEGER,
+            prix_achat_unitaire REAL,
+            date TEXT,
+            FOREIGN KEY(produit_id) REFERENCES produits(id)
+        );
+
+        CREATE TABLE IF NOT EXISTS depenses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT,
+            description TEXT,
+            montant REAL,
+            date TEXT
+        );
+
+        -- Index pour les filtres par période (rapports)
+        CREATE INDEX IF NOT EXISTS idx_ventes_date ON ventes(date);
+        CREATE INDEX IF NOT EXISTS idx_achats_date ON achats(date);
+        CREATE INDEX IF NOT EXISTS idx_depenses_date ON depenses(date);
+        CREATE INDEX IF NOT EXISTS idx_ventes_produit_date ON ventes(produit_id, date);
+
+        -- Résumé par jour et par produit, maintenu dans la même transaction que chaque écriture.
+        -- produit_id = 0 : ligne des dépenses du jour.
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            date TEXT NOT NULL,
+            produit_id INTEGER NOT NULL,
+            qte_vendue INTEGER DEFAULT 0,
+            ca REAL DEFAULT 0,
+            cout REAL DEFAULT 0,
+            qte_achetee INTEGER DEFAULT 0,
+            montant_achats REAL DEFAULT 0,
+            depenses REAL DEFAULT 0,
+            PRIMARY KEY (date, produit_id)
+        ) WITHOUT ROWID;
+
+        -- Tickets de caisse : plusieurs lignes validées en une seule transaction
+        CREATE TABLE IF NOT EXISTS tickets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            nb_lignes INTEGER DEFAULT 0,
+            total REAL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS ticket_lignes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ticket_id INTEGER NOT NULL,
+            vente_id INTEGER,
+            produit_id INTEGER,
+            quantite INTEGER,
+            prix_vente_unitaire REAL,
+            FOREIGN KEY(ticket_id) REFERENCES tickets(id),
+            FOREIGN KEY(vente_id) REFERENCES ventes(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_ticket_lignes_ticket ON ticket_lignes(ticket_id);
+
+        -- Recherche par début de nom / catégorie (LIKE 'abc%' insensible à la casse)
+        CREATE INDEX IF NOT EXISTS idx_produits_nom_nocase ON produits(nom COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_produits_categorie_nocase ON produits(categorie COLLATE NOCASE);
+
+        -- Seuils d'alerte stock : produits.seuil_alerte, sinon seuil de la catégorie, sinon SEUIL_ALERTE_DEFAUT
+        CREATE TABLE IF NOT EXISTS seuils_categorie (
+            categorie TEXT PRIMARY KEY,
+            seuil INTEGER NOT NULL
+        );
+
+        -- Résultats calculés en arrière-plan (scheduler.py), stockés en JSON
+        CREATE TABLE IF NOT EXISTS resultats_precalcules (
+            cle TEXT PRIMARY KEY,
+            calcule_le TEXT NOT NULL,
+            contenu TEXT NOT NULL
+        );
+
+        -- Années archivées : archives/archive_<annee>.db, attachées à chaque connexion (voir archiver_annee)
+        CREATE TABLE IF NOT EXISTS archives (
+            annee INTEGER PRIMARY KEY,
+            fichier TEXT NOT NULL,
+            nb_ventes INTEGER DEFAULT 0,
+            nb_achats INTEGER DEFAULT 0,
+            nb_depenses INTEGER DEFAULT 0,
+            archive_le TEXT
+        );
+
+        -- Dernier id exporté par table (exports incrémentaux, exporter.py)
+        CREATE TABLE IF NOT EXISTS exports_etat (
+            nom_table TEXT PRIMARY KEY,
+            dernier_id INTEGER NOT NULL,
+            exporte_le TEXT NOT NULL
+        );
+        """)
+        fts_exists = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'produits_fts'").fetchone()
+        if not fts_exists:
+            _create_produits_fts(c)
+        # Bases créées avant l'enregistrement du coût à la vente : les coûts manquants et daily_summary
+        # sont calculés à la fin de la migration 2, sur les colonnes entières
+        if "cout_unitaire" not in {r["name"] for r in c.execute("PRAGMA table_info(ventes)")}:
+            c.execute("ALTER TABLE ventes ADD COLUMN cout_unitaire REAL")
+        if "seuil_alerte" not in {r["name"] for r in c.execute("PRAGMA table_info(produits)")}:
+            c.execute("ALTER TABLE produits ADD COLUMN seuil_alerte INTEGER")
+
+BATCH_MIGRATION = 50000  # lignes converties par transaction (migration 2)
+
+# Migration 2 : table -> [(nouvelle colonne, type, ancienne colonne, conversion SQL de l'ancienne valeur)]
+_SQL_CTS = "CAST(ROUND({} * 100) AS INTEGER)"
+_SQL_JOUR = "CAST(julianday({}) - 2440587.5 AS INTEGER)"  # NULL si la date est illisible
+_CONVERSIONS = {
+    "produits": [("prix_vente_cts", "INTEGER DEFAULT 0", "prix_vente", _SQL_CTS),
+                 ("total_revenu_cts", "INTEGER DEFAULT 0", "total_revenu", _SQL_CTS)],
+    "ventes": [("prix_unitaire_cts", "INTEGER", "prix_vente_unitaire", _SQL_CTS),
+               ("jour", "INTEGER", "date", _SQL_JOUR),
+               ("cout_unitaire_cts", "INTEGER", "cout_unitaire", _SQL_CTS)],
+    "achats": [("prix_unitaire_cts", "INTEGER", "prix_achat_unitaire", _SQL_CTS),
+               ("jour", "INTEGER", "date", _SQL_JOUR)],
+    "depenses": [("montant_cts", "INTEGER", "montant", _SQL_CTS),
+                 ("jour", "INTEGER", "date", _SQL_JOUR)],
+    "tickets": [("jour", "INTEGER", "date", _SQL_JOUR),
+                ("total_cts", "INTEGER DEFAULT 0", "total", _SQL_CTS)],
+    "ticket_lignes": [("prix_unitaire_cts", "INTEGER", "prix_vente_unitaire", _SQL_CTS)],
+}
+
+def _convertir_table(conn, schema, table):
+    """
+    Ajoute les nouvelles colonnes, les remplit par lots d'id (une transaction par lot : les autres
+    connexions peuvent écrire entre deux lots), puis supprime les anciennes colonnes et leurs index.
+    Sans effet sur une table déjà convertie ; une conversion interrompue reprend depuis le début.
+    """
+    colonnes = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+    conversions = [conv for conv in _CONVERSIONS[table] if conv[2] in colonnes]
+    if not conversions:
+        return
+    for nouvelle, typ, _, _ in conversions:
+        if nouvelle not in colonnes:
+            conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {nouvelle} {typ}")
+    affectations = ", ".join(f"{nouvelle} = {sql.format(ancienne)}" for nouvelle, _, ancienne, sql in conversions)
+    (max_id,) = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {schema}.{table}").fetchone()
+    for debut in range(0, max_id, BATCH_MIGRATION):
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"UPDATE {schema}.{table} SET {affectations} WHERE id > ? AND id <= ?",
+                     (debut, debut + BATCH_MIGRATION))
+        conn.commit()
+    anciennes = {ancienne for _, _, ancienne, _ in conversions}
+    for (index,) in conn.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'index' "
+                                 "AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall():
+        if anciennes & {r[2] for r in conn.execute(f"PRAGMA {schema}.index_info({index})")}:
+            conn.execute(f"DROP INDEX {schema}.{index}")
+    for ancienne in anciennes:
+        conn.execute(f"ALTER TABLE {schema}.{table} DROP COLUMN {ancienne}")
+
+def _create_index_historique(conn, schema="main"):
+    """
+    Index des tables d'historique (base courante ou archive) : jour pour les périodes et la pagination,
+    et index couvrants (produit_id, jour, quantite, prix) : l'historique d'un produit se lit dans l'index seul.
+    """
+    for nom, table, colonnes in (
+        ("idx_ventes_jour", "ventes", "jour"),
+        ("idx_ventes_produit_jour", "ventes", "produit_id, jour, quantite, prix_unitaire_cts"),
+        ("idx_achats_jour", "achats", "jour"),
+        ("idx_achats_produit_jour", "achats", "produit_id, jour, quantite, prix_unitaire_cts"),
+        ("idx_depenses_jour", "depenses", "jour, montant_cts"),
+    ):
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {schema}.{nom} ON {table}({colonnes})")
+
+def _migration_entiers():
+    """
+    Montants en centimes entiers et dates en numéro de jour, dans la base courante et dans les archives
+    (conversion sur place, table par table, voir _convertir_table), puis VACUUM de chaque fichier.
+    daily_summary est recréé sur les nouvelles colonnes puis reconstruit, après calcul des coûts
+    de vente manquants.
+    """
+    conn = _new_conn()  # connexion dédiée, comme archiver_annee
+    try:
+        # Les vues temporaires *_hist (SELECT *) empêchent ALTER TABLE ... DROP COLUMN
+        for t in ARCHIVE_TABLES:
+            conn.execute(f"DROP VIEW IF EXISTS temp.{t}_hist")
+        archives = [r[1] for r in conn.execute("PRAGMA database_list") if r[1].startswith("arch_")]
+        for schema, table in ([("main", t) for t in _CONVERSIONS]
+                              + [(schema, t) for schema in archives for t in ARCHIVE_TABLES]):
+            _convertir_table(conn, schema, table)
+        if "date" in {r[1] for r in conn.execute("PRAGMA table_info(daily_summary)")}:
+            conn.execute("DROP TABLE daily_summary")
+        conn.executescript("""
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            jour INTEGER NOT NULL,
+            produit_id INTEGER NOT NULL,
+            qte_vendue INTEGER DEFAULT 0,
+            ca_cts INTEGER DEFAULT 0,
+            cout_cts INTEGER DEFAULT 0,
+            qte_achetee INTEGER DEFAULT 0,
+            montant_achats_cts INTEGER DEFAULT 0,
+            depenses_cts INTEGER DEFAULT 0,
+            PRIMARY KEY (jour, produit_id)
+        ) WITHOUT ROWID;
+
+        -- Produits tels que lus par l'application (montants en dh)
+        CREATE VIEW IF NOT EXISTS v_produits AS
+        SELECT id, nom, categorie, prix_achat, prix_vente_cts / 100.0 AS prix_vente, stock, total_vendu,
+               total_revenu_cts / 100.0 AS total_revenu, seuil_alerte
+        FROM produits;
+        """)
+        for schema in ["main"] + archives:
+            _create_index_historique(conn, schema)
+            conn.execute(f"VACUUM {schema}")  # rend la place des anciennes colonnes (REAL et TEXT)
+    finally:
+        conn.close()
+    close_all()  # les connexions rouvertes recréent les vues *_hist sur les nouvelles colonnes
+    with _connect() as c:
+        sans_cout = c.execute("SELECT 1 FROM ventes_hist WHERE cout_unitaire_cts IS NULL LIMIT 1").fetchone()
+    if sans_cout:
+        backfill_couts_ventes()
+    rebuild_daily_summary()
+
+def _migration_previsions():
+    """État du lissage des ventes par produit (prevision.py), voir la section Prévisions de ventes."""
+    with _connect() as c:
+        c.executescript("""
+        CREATE TABLE IF NOT EXISTS previsions (
+            produit_id INTEGER PRIMARY KEY,
+            niveau REAL NOT NULL DEFAULT 0,
+            variance REAL NOT NULL DEFAULT 0,
+            saison BLOB
+        );
+
+        CREATE TABLE IF NOT EXISTS previsions_etat (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            jour_calcule INTEGER,
+            jour_modifie INTEGER
+        );
+        INSERT OR IGNORE INTO previsions_etat (id) VALUES (1);
+        """)
+
+MIGRATIONS = [
+    (1, "schéma initial", _migration_schema_initial),
+    (2, "montants en centimes, dates en numéro de jour", _migration_entiers),
+    (3, "prévisions de ventes", _migration_previsions),
+]
+
+def _create_produits_fts(c):
+    """
+    Index plein texte (FTS5) sur nom et catégorie, synchronisé par triggers : recherche des mots
+    commençant par le texte saisi, même au milieu du nom. Ignoré si SQLite est compilé sans FTS5.
+    """
+    try:
+        c.executescript("""
+        CREATE VIRTUAL TABLE produits_fts USING fts5(
+            nom, categorie, content='produits', content_rowid='id',
+            prefix='1 2 3', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER produits_fts_ai AFTER INSERT ON produits BEGIN
+            INSERT INTO produits_fts(rowid, nom, categorie) VALUES (new.id, new.nom, new.categorie);
+        END;
+        CREATE TRIGGER produits_fts_ad AFTER DELETE ON produits BEGIN
+            INSERT INTO produits_fts(produits_fts, rowid, nom, categorie)
+            VALUES ('delete', old.id, old.nom, old.categorie);
+        END;
+        CREATE TRIGGER produits_fts_au AFTER UPDATE OF nom, categorie ON produits BEGIN
+            INSERT INTO produits_fts(produits_fts, rowid, nom, categorie)
+            VALUES ('delete', old.id, old.nom, old.categorie);
+            INSERT INTO produits_fts(rowid, nom, categorie) VALUES (new.id, new.nom, new.categorie);
+        END;
+        INSERT INTO produits_fts(produits_fts) VALUES ('rebuild');
+        """)
+    except sqlite3.OperationalError:
+        pass  # pas de FTS5 : search_produits se limite à la recherche par préfixe
+
+# ----------------- Coût d'achat (prix moyen pondéré) -----------------
+# Seul endroit où le prix d'achat moyen pondéré est calculé. Chaque vente enregistre dans
+# ventes.cout_unitaire_cts le prix moyen du produit au moment de la vente (arrondi au centime) :
+# un rapport passé ne change plus quand de nouveaux achats arrivent.
+_SQL_COUT_CTS = "CAST(ROUND(COALESCE((SELECT prix_achat FROM produits WHERE id = ?), 0) * 100) AS INTEGER)"
+
+def _apply_entrees_stock(c, entrees):
+    """
+    entrees : itérable de (produit_id, quantite, montant en centimes).
+    Ajoute la quantité au stock et recalcule le prix_achat moyen pondéré (en dh) côté SQL
+    (dans un UPDATE, les colonnes à droite valent leur ancienne valeur).
+    """
+    c.executemany("""
+        UPDATE produits
+        SET prix_achat = CASE WHEN COALESCE(stock, 0) + ? > 0
+                              THEN (COALESCE(prix_achat, 0) * COALESCE(stock, 0) + ?) / (COALESCE(stock, 0) + ?)
+                              ELSE ? END,
+            stock = COALESCE(stock, 0) + ?
+        WHERE id = ?
+    """, ((q, cts / 100, q, cts / 100 / q if q else 0.0, q, pid) for pid, q, cts in entrees))
+
+def _rejouer_mouvements(c, stocks_ouverture, on_vente=None):
+    """
+    Parcourt achats et ventes par ordre de date (achats d'abord à date égale) en suivant pour chaque
+    produit le stock et le prix moyen en centimes, exprimé sous la forme a * P0 + b (P0 : prix du stock
+    d'ouverture). on_vente(vente_id, a, b) est appelé pour chaque vente sans cout_unitaire_cts.
+    Retourne {produit_id: [stock, a, b]} en fin d'historique.
+    """
+    etat = {pid: [stock, 1.0, 0.0] for pid, stock in stocks_ouverture.items()}
+    for sens, mid, pid, quantite, prix, cout, _ in c.execute("""
+        SELECT 0, id, produit_id, quantite, prix_unitaire_cts, NULL, jour FROM achats_hist
+        UNION ALL
+        SELECT 1, id, produit_id, quantite, NULL, cout_unitaire_cts, jour FROM ventes_hist
+        ORDER BY 7, 1, 2
+    """):
+        e = etat.setdefault(pid, [0, 1.0, 0.0])
+        q = quantite or 0
+        if sens == 0:
+            total = e[0] + q
+            if total > 0:
+                e[1], e[2] = e[1] * e[0] / total, (e[2] * e[0] + (prix or 0.0) * q) / total
+            else:
+                e[1], e[2] = 0.0, prix or 0.0
+            e[0] = total
+        else:
+            if cout is None and on_vente is not None:
+                on_vente(mid, pid, e[1], e[2])
+            e[0] = max(e[0] - q, 0)
+    return etat
+
+def backfill_couts_ventes(batch_size=10000):
+    """
+    Renseigne ventes.cout_unitaire_cts là où il manque, en rejouant achats et ventes par ordre de date.
+
+    Le stock d'ouverture de chaque produit (saisi hors achats) vaut stock courant - achats + ventes.
+    Son prix P0 est inconnu, mais le prix moyen rejoué est affine en P0 : une première passe
+    en déduit le P0 qui redonne le prix_achat courant, une seconde écrit les coûts par lots.
+    Retourne le nombre de ventes mises à jour.
+    """
+    with transaction() as c:
+        produits = c.execute("""
+            SELECT p.id, COALESCE(p.prix_achat, 0),
+                   COALESCE(p.stock, 0)
+                   - COALESCE(a.qte, 0) + COALESCE(v.qte, 0)
+            FROM produits p
+            LEFT JOIN (SELECT produit_id, SUM(quantite) AS qte FROM achats_hist GROUP BY produit_id) a
+                   ON a.produit_id = p.id
+            LEFT JOIN (SELECT produit_id, SUM(quantite) AS qte FROM ventes_hist GROUP BY produit_id) v
+                   ON v.produit_id = p.id
+        """).fetchall()
+        ouverture = {pid: max(stock, 0) for pid, _, stock in produits}
+        prix_courant = {pid: prix * 100 for pid, prix, _ in produits}  # centimes
+
+        # Passe 1 : P0 tel que a * P0 + b = prix_achat courant
+        p0 = {}
+        for pid, (_, a, b) in _rejouer_mouvements(c, ouverture).items():
+            prix = prix_courant.get(pid, 0.0)
+            p0[pid] = max((prix - b) / a, 0.0) if a > 1e-6 else prix
+
+        # Passe 2 : écriture des coûts par lots
+        updates, nb = [], 0
+
+        def on_vente(vid, pid, a, b):
+            nonlocal updates, nb
+            updates.append((_cts((a * p0.get(pid, 0.0) + b) / 100), vid))
+            if len(updates) >= batch_size:
+                c.executemany("UPDATE ventes SET cout_unitaire_cts = ? WHERE id = ?", updates)
+                nb += len(updates)
+                updates = []
+
+        _rejouer_mouvements(c, ouverture, on_vente)
+        if updates:
+            c.executemany("UPDATE ventes SET cout_unitaire_cts = ? WHERE id = ?", updates)
+            nb += len(updates)
+    return nb
 
 # ----------------- Produits -----------------
 def add_or_update_produit(nom, categorie="", stock=0, prix_achat=0.0, prix_vente=0.0):
@@ -59,48 +601,35 @@ def add_or_update_produit(nom, categorie="", stock=0, prix_achat=0.0, prix_vente
     Si le produit existe, on met à jour : stock += stock, prix_achat moyen pondéré si stock>0 fourni.
     Sinon on l'insère.
     """
-    c = _get_conn()
-    cur = c.cursor()
-    cur.execute("SELECT * FROM produits WHERE nom = ?", (nom.strip(),))
-    row = cur.fetchone()
-    if row:
-        # calcul prix achat moyen pondéré si on fournit une quantité > 0
-        ancien_stock = row["stock"] or 0
-        ancien_prix = row["prix_achat"] or 0.0
-        new_stock = ancien_stock + int(stock)
-        if int(stock) > 0 and new_stock > 0:
-            prix_moy = (ancien_prix * ancien_stock + float(prix_achat) * int(stock)) / new_stock
+    with transaction() as c:
+        row = c.execute("SELECT id FROM produits WHERE nom = ?", (nom.strip(),)).fetchone()
+        if row:
+            c.execute("""
+                UPDATE produits
+                SET prix_vente_cts = CASE WHEN ? > 0 THEN ? ELSE prix_vente_cts END, categorie = ?
+                WHERE id = ?
+            """, (_cts(prix_vente), _cts(prix_vente), categorie, row["id"]))
+            if int(stock) > 0:
+                _apply_entrees_stock(c, [(row["id"], int(stock), _cts(prix_achat) * int(stock))])
+            elif int(stock) < 0:  # correction d'inventaire : le prix moyen ne change pas
+                c.execute("UPDATE produits SET stock = stock + ? WHERE id = ?", (int(stock), row["id"]))
         else:
-            prix_moy = ancien_prix
-        prix_vente_final = float(prix_vente) if float(prix_vente) > 0 else row["prix_vente"]
-        cur.execute("""
-            UPDATE produits
-            SET stock = ?, prix_achat = ?, prix_vente = ?, categorie = ?
-            WHERE id = ?
-        """, (new_stock, prix_moy, prix_vente_final, categorie, row["id"]))
-    else:
-        cur.execute("""
-            INSERT INTO produits (nom, categorie, stock, prix_achat, prix_vente)
-            VALUES (?, ?, ?, ?, ?)
-        """, (nom.strip(), categorie, int(stock), float(prix_achat), float(prix_vente)))
-    c.commit()
-    c.close()
+            c.execute("""
+                INSERT INTO produits (nom, categorie, stock, prix_achat, prix_vente_cts)
+                VALUES (?, ?, ?, ?, ?)
+            """, (nom.strip(), categorie, int(stock), float(prix_achat), _cts(prix_vente)))
 
+@cache.cached
 def get_produits():
-    c = _get_conn()
-    rows = c.execute("SELECT * FROM produits ORDER BY nom").fetchall()
-    c.close()
-    return rows
+    with _connect() as c:
+        return c.execute("SELECT * FROM v_produits ORDER BY nom").fetchall()
 
+@cache.cached
 def get_produit_by_id(pid):
-    c = _get_conn()
-    row = c.execute("SELECT * FROM produits WHERE id = ?", (pid,)).fetchone()
-    c.close()
-    return row
+    with _connect() as c:
+        return c.execute("SELECT * FROM v_produits WHERE id = ?", (pid,)).fetchone()
 
 def update_produit(pid, nom=None, categorie=None, prix_achat=None, prix_vente=None, stock=None):
-    c = _get_conn()
-    cur = c.cursor()
     # Build dynamic update
     fields, vals = [], []
     if nom is not None:
@@ -110,124 +639,803 @@ def update_produit(pid, nom=None, categorie=None, prix_achat=None, prix_vente=No
     if prix_achat is not None:
         fields.append("prix_achat = ?"); vals.append(float(prix_achat))
     if prix_vente is not None:
-        fields.append("prix_vente = ?"); vals.append(float(prix_vente))
+        fields.append("prix_vente_cts = ?"); vals.append(_cts(prix_vente))
     if stock is not None:
         fields.append("stock = ?"); vals.append(int(stock))
     if not fields:
-        c.close(); return
+        return
     vals.append(pid)
     sql = f"UPDATE produits SET {', '.join(fields)} WHERE id = ?"
-    cur.execute(sql, tuple(vals))
-    c.commit()
-    c.close()
+    with transaction() as c:
+        c.execute(sql, tuple(vals))
 
 def delete_produit(pid):
-    c = _get_conn()
-    cur = c.cursor()
-    cur.execute("DELETE FROM produits WHERE id = ?", (pid,))
-    # Note: on ne supprime pas ventes/achats liés pour conserver historique (optionnel)
-    c.commit()
-    c.close()
+    with transaction() as c:
+        c.execute("DELETE FROM produits WHERE id = ?", (pid,))
+        # Note: on ne supprime pas ventes/achats liés pour conserver historique (optionnel)
+
+@cache.cached
+def get_produit_ids_by_nom():
+    """Dictionnaire nom -> id (résolution des noms lors des imports)."""
+    with _connect() as c:
+        return {r["nom"]: r["id"] for r in c.execute("SELECT id, nom FROM produits")}
+
+# ----------------- Seuils d'alerte stock -----------------
+SEUIL_ALERTE_DEFAUT = 5  # produits sans seuil propre ni seuil de catégorie
+
+_SQL_SOUS_SEUIL = """
+    SELECT p.*, COALESCE(p.seuil_alerte, s.seuil, ?) AS seuil
+    FROM v_produits p
+    LEFT JOIN seuils_categorie s ON s.categorie = p.categorie
+    WHERE p.stock <= COALESCE(p.seuil_alerte, s.seuil, ?)
+    ORDER BY p.stock ASC
+"""
 
-def get_produits_stock_below(threshold):
-    c = _get_conn()
-    rows = c.execute("SELECT * FROM produits WHERE stock <= ? ORDER BY stock ASC", (threshold,)).fetchall()
-    c.close()
-    return rows
+def set_seuil_produit(pid, seuil):
+    """seuil=None : le produit reprend le seuil de sa catégorie (ou le seuil par défaut)."""
+    with transaction() as c:
+        c.execute("UPDATE produits SET seuil_alerte = ? WHERE id = ?",
+                  (None if seuil is None else int(seuil), pid))
+
+def set_seuil_categorie(categorie, seuil):
+    """seuil=None : supprime le seuil de la catégorie."""
+    with transaction() as c:
+        if seuil is None:
+            c.execute("DELETE FROM seuils_categorie WHERE categorie = ?", (categorie,))
+        else:
+            c.execute("INSERT INTO seuils_categorie (categorie, seuil) VALUES (?, ?) "
+                      "ON CONFLICT(categorie) DO UPDATE SET seuil = excluded.seuil", (categorie, int(seuil)))
+
+@cache.cached
+def get_seuils_categorie():
+    """Dictionnaire catégorie -> seuil."""
+    with _connect() as c:
+        return {r["categorie"]: r["seuil"] for r in c.execute("SELECT categorie, seuil FROM seuils_categorie")}
+
+@cache.cached
+def get_produits_sous_seuil():
+    """Produits dont le stock est au plus à leur seuil effectif (colonne seuil)."""
+    with _connect() as c:
+        return c.execute(_SQL_SOUS_SEUIL, (SEUIL_ALERTE_DEFAUT, SEUIL_ALERTE_DEFAUT)).fetchall()
+
+@cache.cached
+def search_produits(prefix="", limit=20):
+    """
+    Recherche incrémentale (à chaque frappe) : d'abord les produits dont le nom ou la catégorie
+    commence par prefix (index NOCASE, ordre alphabétique), puis complétés par les produits dont
+    un mot commence par chacun des mots saisis (FTS5). Lit au plus limit lignes par requête :
+    la latence ne dépend pas de la taille du catalogue.
+    """
+    prefix = (prefix or "").strip()
+    with _connect() as c:
+        if not prefix:
+            return c.execute("SELECT * FROM v_produits ORDER BY nom LIMIT ?", (limit,)).fetchall()
+        motif = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        rows = c.execute("""
+            SELECT * FROM (
+                SELECT * FROM v_produits WHERE nom LIKE ? ESCAPE '\\' ORDER BY nom COLLATE NOCASE LIMIT ?
+            )
+            UNION
+            SELECT * FROM (
+                SELECT * FROM v_produits WHERE categorie LIKE ? ESCAPE '\\' ORDER BY categorie COLLATE NOCASE LIMIT ?
+            )
+            ORDER BY nom COLLATE NOCASE LIMIT ?
+        """, (motif, limit, motif, limit, limit)).fetchall()
+        if len(rows) < limit:
+            deja = {r["id"] for r in rows}
+            requete = " ".join('"' + mot.replace('"', '""') + '"*' for mot in prefix.split())
+            try:
+                rows += [r for r in c.execute("""
+                    SELECT p.* FROM produits_fts f JOIN v_produits p ON p.id = f.rowid
+                    WHERE produits_fts MATCH ? LIMIT ?
+                """, (requete, limit + len(deja))) if r["id"] not in deja][:limit - len(rows)]
+            except sqlite3.OperationalError:
+                pass  # FTS5 indisponible
+        return rows
+
+@cache.cached
+def get_categories():
+    with _connect() as c:
+        return [r[0] for r in c.execute(
+            "SELECT DISTINCT categorie FROM produits WHERE categorie != '' ORDER BY categorie")]
+
+# ----------------- Historique paginé -----------------
+def _colonnes(table, jour_brut=False):
+    """
+    Colonnes d'une table d'historique (alias t) telles que lues par l'application : montants en dh
+    et date 'YYYY-MM-DD' (jour_brut=True : numéro de jour, converti en datetime64 par _typed_frame).
+    """
+    date_col = "t.jour AS date" if jour_brut else _SQL_DATE.format("t.jour") + " AS date"
+    return {
+        "ventes": f"t.id, t.produit_id, t.quantite, t.prix_unitaire_cts / 100.0 AS prix_vente_unitaire, {date_col}, "
+                  "t.cout_unitaire_cts / 100.0 AS cout_unitaire",
+        "achats": f"t.id, t.produit_id, t.quantite, t.prix_unitaire_cts / 100.0 AS prix_achat_unitaire, {date_col}",
+        "depenses": f"t.id, t.type, t.description, t.montant_cts / 100.0 AS montant, {date_col}",
+    }[table]
+
+def _history_page(table, cursor, limit, produit_id, categorie, date_from, date_to, as_df=False):
+    """
+    Pagination par clé (keyset) sur (jour, id) décroissants : chaque page lit au plus limit + 1 lignes
+    via l'index sur jour (ou produit_id, jour), quelle que soit la taille de l'historique.
+    Avec des archives, la même requête est faite sur la base courante et sur chaque archive concernée
+    par les dates, puis les résultats sont fusionnés (au plus limit + 1 lignes par base).
+    cursor : (jour, id) de la dernière ligne de la page précédente, None pour la première page.
+    Retourne (lignes, cursor_suivant) ; cursor_suivant vaut None sur la dernière page.
+    Avec as_df=True, les lignes sont un DataFrame typé (voir query_df).
+    """
+    where, params = [], []
+    if produit_id is not None:
+        where.append("t.produit_id = ?"); params.append(produit_id)
+    if categorie:
+        # + : pas d'index sur produit_id, la requête parcourt idx_*_jour dans l'ordre de la page et
+        # s'arrête après limit + 1 lignes (sinon toutes les lignes de la catégorie sont lues puis triées)
+        where.append("+t.produit_id IN (SELECT id FROM main.produits WHERE categorie = ?)"); params.append(categorie)
+    if date_from:
+        where.append("t.jour >= ?"); params.append(_jour(date_from))
+    if date_to:
+        where.append("t.jour <= ?"); params.append(_jour(date_to))
+    if cursor is not None:
+        where.append("(t.jour, t.id) < (?, ?)"); params.extend(cursor)
+    params.append(limit + 1)
+    with _connect() as c:
+        cur = c.cursor()
+        if as_df:
+            cur.row_factory = None
+        rows, columns = [], None
+        sources = _sources(c, date_from, min(filter(None, [date_to, cursor and _date_str(cursor[0])]), default=None))
+        for schema in sources:
+            cur.execute(f"""
+                SELECT {_colonnes(table, as_df)}, p.nom AS produit_nom, p.categorie FROM {schema}.{table} t
+                LEFT JOIN main.produits p ON t.produit_id = p.id
+                {"WHERE " + " AND ".join(where) if where else ""}
+                ORDER BY t.jour DESC, t.id DESC LIMIT ?
+            """, params)
+            columns = [d[0] for d in cur.description]
+            rows.extend(cur.fetchall())
+    i_date, i_id = columns.index("date"), columns.index("id")
+    if len(sources) > 1:
+        # Même ordre que jour : numéro de jour (as_df) ou 'YYYY-MM-DD'
+        rows.sort(key=lambda r: (r[i_date] is not None, r[i_date] or 0, r[i_id]), reverse=True)
+    suivant = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        dernier = rows[-1][i_date]
+        suivant = (dernier if as_df or dernier is None else _jour(dernier), rows[-1][i_id])
+    return (_typed_frame(columns, rows) if as_df else rows), suivant
 
 # ----------------- Achats -----------------
+def _insert_achats(c, achats):
+    """
+    Insère les achats (produit_id, quantite, prix_achat_unitaire, date_str) via executemany,
+    puis applique une seule mise à jour de stock / prix achat moyen pondéré par produit.
+    """
+    agg = {}  # produit_id -> [quantité, montant en centimes]
+    par_jour = {}  # (jour, produit_id) -> [quantité, montant en centimes]
+
+    def rows():
+        for produit_id, quantite, prix_unitaire, date_str in achats:
+            q, pu = int(quantite), _cts(prix_unitaire)
+            jour = _jour(date_str or _today())
+            for a in (agg.setdefault(produit_id, [0, 0]), par_jour.setdefault((jour, produit_id), [0, 0])):
+                a[0] += q
+                a[1] += q * pu
+            yield (produit_id, q, pu, jour)
+
+    cur = c.executemany("INSERT INTO achats (produit_id, quantite, prix_unitaire_cts, jour) VALUES (?, ?, ?, ?)",
+                        rows())
+    c.executemany("""
+        INSERT INTO daily_summary (jour, produit_id, qte_achetee, montant_achats_cts) VALUES (?, ?, ?, ?)
+        ON CONFLICT(jour, produit_id) DO UPDATE
+        SET qte_achetee = qte_achetee + excluded.qte_achetee,
+            montant_achats_cts = montant_achats_cts + excluded.montant_achats_cts
+    """, ((j, pid, q, montant) for (j, pid), (q, montant) in par_jour.items()))
+    _apply_entrees_stock(c, ((pid, q, montant) for pid, (q, montant) in agg.items()))
+    return cur.rowcount
+
 def add_achat(produit_id, quantite, prix_achat_unitaire, date_str=None):
-    if date_str is None:
-        date_str = datetime.now().strftime("%Y-%m-%d")
-    c = _get_conn()
-    cur = c.cursor()
-    cur.execute("INSERT INTO achats (produit_id, quantite, prix_achat_unitaire, date) VALUES (?, ?, ?, ?)",
-                (produit_id, int(quantite), float(prix_achat_unitaire), date_str))
-    # Mettre à jour stock et prix achat moyen pondéré
-    cur.execute("SELECT stock, prix_achat FROM produits WHERE id = ?", (produit_id,))
-    row = cur.fetchone()
-    if row:
-        ancien_stock = row["stock"] or 0
-        ancien_prix = row["prix_achat"] or 0.0
-        total_q = ancien_stock + int(quantite)
-        if total_q > 0:
-            prix_moy = (ancien_prix * ancien_stock + float(prix_achat_unitaire) * int(quantite)) / total_q
-        else:
-            prix_moy = float(prix_achat_unitaire)
-        cur.execute("UPDATE produits SET stock = ?, prix_achat = ? WHERE id = ?", (total_q, prix_moy, produit_id))
-    c.commit()
-    c.close()
+    with transaction() as c:
+        _insert_achats(c, [(produit_id, quantite, prix_achat_unitaire, date_str)])
+
+def add_achats_bulk(achats):
+    """
+    Enregistre un lot d'achats (itérable de (produit_id, quantite, prix_achat_unitaire, date_str))
+    dans une seule transaction. Retourne le nombre de lignes insérées.
+    """
+    with transaction() as c:
+        return _insert_achats(c, achats)
 
 def get_achats(limit=500):
-    c = _get_conn()
-    rows = c.execute("""
-        SELECT a.*, p.nom AS produit_nom FROM achats a
-        LEFT JOIN produits p ON a.produit_id = p.id
-        ORDER BY date DESC LIMIT ?
-    """, (limit,)).fetchall()
-    c.close()
-    return rows
+    with _connect() as c:
+        return c.execute(f"""
+            SELECT {_colonnes("achats")}, p.nom AS produit_nom FROM achats_hist t
+            LEFT JOIN produits p ON t.produit_id = p.id
+            ORDER BY t.jour DESC, t.id DESC LIMIT ?
+        """, (limit,)).fetchall()
+
+@cache.cached
+def get_achats_page(cursor=None, limit=50, produit_id=None, categorie=None, date_from=None, date_to=None,
+                    as_df=False):
+    """Page d'historique des achats, filtrée côté serveur. Voir _history_page."""
+    return _history_page("achats", cursor, limit, produit_id, categorie, date_from, date_to, as_df)
 
 # ----------------- Ventes -----------------
-def add_vente(produit_id, quantite, prix_vente_unitaire, date_str=None):
-    if date_str is None:
-        date_str = datetime.now().strftime("%Y-%m-%d")
-    c = _get_conn()
-    cur = c.cursor()
-    cur.execute("INSERT INTO ventes (produit_id, quantite, prix_vente_unitaire, date) VALUES (?, ?, ?, ?)",
-                (produit_id, int(quantite), float(prix_vente_unitaire), date_str))
-    # Mise à jour produit : stock, total_vendu, total_revenu
-    cur.execute("""
-        UPDATE produits
-        SET stock = stock - ?, total_vendu = total_vendu + ?, total_revenu = total_revenu + ?
-        WHERE id = ?
-    """, (int(quantite), int(quantite), int(quantite) * float(prix_vente_unitaire), produit_id))
-    c.commit()
-    c.close()
+def _insert_ventes(c, ventes, check_stock=False):
+    """
+    Insère les ventes (produit_id, quantite, prix_vente_unitaire, date_str) via executemany,
+    puis met à jour stock, total_vendu et total_revenu une seule fois par produit.
+    check_stock=True : la décrémentation n'a lieu que si stock >= quantité (test et mise à jour
+    dans le même UPDATE) ; sinon StockInsuffisantError est levée et la transaction annulée.
+    """
+    agg = {}  # produit_id -> [quantité, revenu en centimes]
+    par_jour = {}  # (jour, produit_id) -> [quantité, revenu en centimes]
+
+    def rows():
+        for produit_id, quantite, prix_unitaire, date_str in ventes:
+            q, pu = int(quantite), _cts(prix_unitaire)
+            jour = _jour(date_str or _today())
+            for a in (agg.setdefault(produit_id, [0, 0]), par_jour.setdefault((jour, produit_id), [0, 0])):
+                a[0] += q
+                a[1] += q * pu
+            yield (produit_id, q, pu, jour, produit_id)
+
+    # cout_unitaire_cts : prix d'achat moyen du produit au moment de la vente
+    cur = c.executemany(f"""
+        INSERT INTO ventes (produit_id, quantite, prix_unitaire_cts, jour, cout_unitaire_cts)
+        VALUES (?, ?, ?, ?, {_SQL_COUT_CTS})
+    """, rows())
+    # Résumé journalier (même coût que celui enregistré sur les ventes)
+    c.executemany(f"""
+        INSERT INTO daily_summary (jour, produit_id, qte_vendue, ca_cts, cout_cts)
+        VALUES (?, ?, ?, ?, ? * {_SQL_COUT_CTS})
+        ON CONFLICT(jour, produit_id) DO UPDATE
+        SET qte_vendue = qte_vendue + excluded.qte_vendue,
+            ca_cts = ca_cts + excluded.ca_cts,
+            cout_cts = cout_cts + excluded.cout_cts
+    """, ((j, pid, q, revenu, q, pid) for (j, pid), (q, revenu) in par_jour.items()))
+    # Vente saisie sur un jour passé : si ce jour est déjà intégré aux prévisions, elles seront recalculées
+    jour_min = min((j for j, _ in par_jour), default=None)
+    if jour_min is not None and jour_min < _jour(_today()):
+        c.execute("UPDATE previsions_etat SET jour_modifie = MIN(COALESCE(jour_modifie, ?1), ?1) "
+                  "WHERE id = 1 AND jour_calcule >= ?1", (jour_min,))
+    # Mise à jour produit : stock, total_vendu, total_revenu_cts
+    if check_stock:
+        for pid, (q, revenu) in agg.items():
+            updated = c.execute("""
+                UPDATE produits
+                SET stock = stock - ?, total_vendu = total_vendu + ?, total_revenu_cts = total_revenu_cts + ?
+                WHERE id = ? AND stock >= ?
+            """, (q, q, revenu, pid, q)).rowcount
+            if not updated:
+                row = c.execute("SELECT stock FROM produits WHERE id = ?", (pid,)).fetchone()
+                raise StockInsuffisantError(pid, q, row["stock"] if row else None)
+    else:
+        c.executemany("""
+            UPDATE produits
+            SET stock = stock - ?, total_vendu = total_vendu + ?, total_revenu_cts = total_revenu_cts + ?
+            WHERE id = ?
+        """, ((q, q, revenu, pid) for pid, (q, revenu) in agg.items()))
+    return cur.rowcount
+
+def add_vente(produit_id, quantite, prix_vente_unitaire, date_str=None, check_stock=False):
+    """check_stock=True : refuse la vente (StockInsuffisantError) si le stock ne suffit pas."""
+    with transaction() as c:
+        _insert_ventes(c, [(produit_id, quantite, prix_vente_unitaire, date_str)], check_stock)
+
+def add_ventes_bulk(ventes, check_stock=False):
+    """
+    Enregistre un lot de ventes (itérable de (produit_id, quantite, prix_vente_unitaire, date_str))
+    dans une seule transaction. Retourne le nombre de lignes insérées.
+    check_stock=True : tout le lot est refusé si un produit n'a pas assez de stock.
+    """
+    with transaction() as c:
+        return _insert_ventes(c, ventes, check_stock)
 
 def get_ventes(limit=500):
-    c = _get_conn()
-    rows = c.execute("""
-        SELECT v.*, p.nom AS produit_nom FROM ventes v
-        LEFT JOIN produits p ON v.produit_id = p.id
-        ORDER BY date DESC LIMIT ?
-    """, (limit,)).fetchall()
-    c.close()
-    return rows
+    with _connect() as c:
+        return c.execute(f"""
+            SELECT {_colonnes("ventes")}, p.nom AS produit_nom FROM ventes_hist t
+            LEFT JOIN produits p ON t.produit_id = p.id
+            ORDER BY t.jour DESC, t.id DESC LIMIT ?
+        """, (limit,)).fetchall()
+
+@cache.cached
+def get_ventes_page(cursor=None, limit=50, produit_id=None, categorie=None, date_from=None, date_to=None,
+                    as_df=False):
+    """Page d'historique des ventes, filtrée côté serveur. Voir _history_page."""
+    return _history_page("ventes", cursor, limit, produit_id, categorie, date_from, date_to, as_df)
+
+# ----------------- Tickets -----------------
+def add_ticket(lignes, date_str=None, check_stock=False):
+    """
+    Enregistre un ticket (panier) : lignes = itérable de (produit_id, quantite, prix_vente_unitaire).
+    Ticket, lignes, ventes et mises à jour de tous les produits concernés sont validés
+    dans une seule transaction. Retourne l'id du ticket.
+    check_stock=True : tout le ticket est refusé (StockInsuffisantError) si un produit manque de stock.
+    """
+    with transaction() as c:
+        return _insert_ticket(c, lignes, date_str, check_stock)
+
+def _insert_ticket(c, lignes, date_str=None, check_stock=False):
+    lignes = [(pid, int(q), float(pu)) for pid, q, pu in lignes]
+    if not lignes:
+        raise ValueError("Ticket vide.")
+    date_str = date_str or _today()
+    ticket_id = c.execute("INSERT INTO tickets (jour, nb_lignes, total_cts) VALUES (?, ?, ?)",
+                          (_jour(date_str), len(lignes), sum(q * _cts(pu) for _, q, pu in lignes))).lastrowid
+    # AUTOINCREMENT + verrou d'écriture : les ventes du ticket sont celles d'id > dernier id
+    (dernier_id,) = c.execute("SELECT COALESCE(MAX(id), 0) FROM ventes").fetchone()
+    _insert_ventes(c, ((pid, q, pu, date_str) for pid, q, pu in lignes), check_stock)
+    c.execute("""
+        INSERT INTO ticket_lignes (ticket_id, vente_id, produit_id, quantite, prix_unitaire_cts)
+        SELECT ?, id, produit_id, quantite, prix_unitaire_cts FROM ventes WHERE id > ? ORDER BY id
+    """, (ticket_id, dernier_id))
+    return ticket_id
+
+@cache.cached
+def get_ticket_lignes(ticket_id):
+    with _connect() as c:
+        return c.execute("""
+            SELECT l.id, l.ticket_id, l.vente_id, l.produit_id, l.quantite,
+                   l.prix_unitaire_cts / 100.0 AS prix_vente_unitaire, p.nom AS produit_nom
+            FROM ticket_lignes l
+            LEFT JOIN produits p ON l.produit_id = p.id
+            WHERE l.ticket_id = ? ORDER BY l.id
+        """, (ticket_id,)).fetchall()
+
+@cache.cached
+def get_tickets(limit=50):
+    with _connect() as c:
+        return c.execute(f"""
+            SELECT id, {_SQL_DATE.format("jour")} AS date, nb_lignes, total_cts / 100.0 AS total
+            FROM tickets ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
 
 # ----------------- Depenses -----------------
+def _insert_depenses(c, depenses):
+    """Insère les dépenses (type, montant, description, date_str) et met à jour daily_summary."""
+    par_jour = {}  # jour -> montant en centimes
+
+    def rows():
+        for type_dep, montant, description, date_str in depenses:
+            m, jour = _cts(montant), _jour(date_str or _today())
+            par_jour[jour] = par_jour.get(jour, 0) + m
+            yield (type_dep, description or "", m, jour)
+
+    cur = c.executemany("INSERT INTO depenses (type, description, montant_cts, jour) VALUES (?, ?, ?, ?)", rows())
+    c.executemany("""
+        INSERT INTO daily_summary (jour, produit_id, depenses_cts) VALUES (?, 0, ?)
+        ON CONFLICT(jour, produit_id) DO UPDATE SET depenses_cts = depenses_cts + excluded.depenses_cts
+    """, par_jour.items())
+    return cur.rowcount
+
 def add_depense(type_dep, montant, description="", date_str=None):
-    if date_str is None:
-        date_str = datetime.now().strftime("%Y-%m-%d")
-    c = _get_conn()
-    cur = c.cursor()
-    cur.execute("INSERT INTO depenses (type, description, montant, date) VALUES (?, ?, ?, ?)",
-                (type_dep, description, float(montant), date_str))
-    c.commit()
-    c.close()
+    with transaction() as c:
+        _insert_depenses(c, [(type_dep, montant, description, date_str)])
+
+def add_depenses_bulk(depenses):
+    """Enregistre un lot de dépenses (type, montant, description, date_str) dans une seule transaction."""
+    with transaction() as c:
+        return _insert_depenses(c, depenses)
 
 def get_depenses(limit=500):
-    c = _get_conn()
-    rows = c.execute("SELECT * FROM depenses ORDER BY date DESC LIMIT ?", (limit,)).fetchall()
-    c.close()
-    return rows
+    with _connect() as c:
+        return c.execute(f"SELECT {_colonnes('depenses')} FROM depenses_hist t "
+                         "ORDER BY t.jour DESC, t.id DESC LIMIT ?", (limit,)).fetchall()
+
+# ----------------- Écritures groupées -----------------
+_BATCH_WRITERS = {
+    "ventes": lambda c, lignes, check_stock: _insert_ventes(c, lignes, check_stock),
+    "achats": lambda c, lignes, check_stock: _insert_achats(c, lignes),
+    "depenses": lambda c, lignes, check_stock: _insert_depenses(c, lignes),
+    "ticket": lambda c, ticket, check_stock: _insert_ticket(c, ticket[0], ticket[1], check_stock),
+}
+
+def write_batch(operations):
+    """
+    Valide plusieurs opérations d'écriture dans une seule transaction (un seul COMMIT).
+    operations : liste de (type, données, check_stock) avec type parmi ventes / achats / depenses
+    (données : lignes comme pour add_*_bulk) ou ticket (données : (lignes, date_str)).
+    Chaque opération a son SAVEPOINT : une opération refusée (stock insuffisant, valeur invalide)
+    est annulée seule. Retourne une liste de (résultat, exception ou None), dans l'ordre.
+    """
+    resultats = []
+    with transaction() as c:
+        for kind, donnees, check_stock in operations:
+            c.execute("SAVEPOINT operation")
+            try:
+                resultat = _BATCH_WRITERS[kind](c, donnees, check_stock)
+            except sqlite3.OperationalError:
+                raise  # base verrouillée, disque plein : toute la transaction échoue
+            except Exception as e:  # opération refusée (stock, valeur invalide, dépassement d'entier…)
+                c.execute("ROLLBACK TO operation")
+                c.execute("RELEASE operation")
+                resultats.append((None, e))
+            else:
+                c.execute("RELEASE operation")
+                resultats.append((resultat, None))
+    return resultats
+
+# ----------------- Rapports -----------------
+# Les rapports lisent daily_summary : O(jours × produits vendus) au lieu de O(ventes).
+def rebuild_daily_summary():
+    """
+    Reconstruit daily_summary à partir de ventes, achats et dépenses (archives comprises).
+    Le coût des ventes est ventes.cout_unitaire_cts (prix_achat courant à défaut).
+    Les lignes sans jour (date illisible lors de la migration 2) sont ignorées.
+    """
+    with transaction() as c:
+        c.execute("DELETE FROM daily_summary")
+        c.execute(f"""
+            INSERT INTO daily_summary (jour, produit_id, qte_vendue, ca_cts, cout_cts)
+            SELECT v.jour, v.produit_id, SUM(v.quantite), SUM(v.quantite * v.prix_unitaire_cts),
+                   SUM(v.quantite * COALESCE(v.cout_unitaire_cts, {_SQL_CTS.format("p.prix_achat")}, 0))
+            FROM ventes_hist v
+            LEFT JOIN produits p ON v.produit_id = p.id
+            WHERE v.jour IS NOT NULL
+            GROUP BY v.jour, v.produit_id
+        """)
+        c.execute("""
+            INSERT INTO daily_summary (jour, produit_id, qte_achetee, montant_achats_cts)
+            SELECT jour, produit_id, SUM(quantite), SUM(quantite * prix_unitaire_cts)
+            FROM achats_hist
+            WHERE jour IS NOT NULL
+            GROUP BY jour, produit_id
+            ON CONFLICT(jour, produit_id) DO UPDATE
+            SET qte_achetee = excluded.qte_achetee, montant_achats_cts = excluded.montant_achats_cts
+        """)
+        c.execute("""
+            INSERT INTO daily_summary (jour, produit_id, depenses_cts)
+            SELECT jour, 0, SUM(montant_cts) FROM depenses_hist WHERE jour IS NOT NULL GROUP BY jour
+        """)
+        try:
+            c.execute("UPDATE previsions_etat SET jour_calcule = NULL")  # prévisions à recalculer
+        except sqlite3.OperationalError:
+            pass  # appel par la migration 2 : table créée par la migration 3
+
+@cache.cached
+def get_report_totals(from_date, to_date):
+    """
+    Totaux de la période [from_date, to_date] (bornes incluses, 'YYYY-MM-DD').
+    Retourne (ca, cout_achat, depenses) en dh : sommes exactes en centimes, converties à la fin.
+    """
+    with _connect() as c:
+        ca, cout_achat, depenses = c.execute("""
+            SELECT COALESCE(SUM(ca_cts), 0), COALESCE(SUM(cout_cts), 0), COALESCE(SUM(depenses_cts), 0)
+            FROM daily_summary
+            WHERE jour BETWEEN ? AND ?
+        """, (_jour(from_date), _jour(to_date))).fetchone()
+    return ca / 100, cout_achat / 100, depenses / 100
+
+@cache.cached
+def get_top_produits(from_date, to_date):
+    """Quantité et revenu par produit sur la période, triés par quantité décroissante."""
+    with _connect() as c:
+        return c.execute("""
+            SELECT COALESCE(p.nom, '—') AS produit, s.qty, s.revenu
+            FROM (
+                SELECT produit_id, SUM(qte_vendue) AS qty, SUM(ca_cts) / 100.0 AS revenu
+                FROM daily_summary
+                WHERE jour BETWEEN ? AND ? AND produit_id != 0
+                GROUP BY produit_id
+                HAVING SUM(qte_vendue) > 0
+            ) s
+            LEFT JOIN produits p ON s.produit_id = p.id
+            ORDER BY s.qty DESC
+        """, (_jour(from_date), _jour(to_date))).fetchall()
+
+@cache.cached
+def get_ca_by_day(from_date, to_date):
+    with _connect() as c:
+        return c.execute(f"""
+            SELECT {_SQL_DATE.format("jour")} AS date, SUM(ca_cts) / 100.0 AS ca
+            FROM daily_summary
+            WHERE jour BETWEEN ? AND ? AND produit_id != 0
+            GROUP BY jour
+            HAVING SUM(qte_vendue) > 0
+            ORDER BY jour
+        """, (_jour(from_date), _jour(to_date))).fetchall()
+
+# ----------------- Lecture en DataFrame -----------------
+# Types compacts appliqués par nom de colonne (float32 : affichage ; les sommes se font en centimes ou en float64)
+_INT32_COLS = {"id", "produit_id", "quantite", "stock", "total_vendu", "qte_vendue", "qte_achetee",
+               "seuil_alerte", "seuil"}
+_FLOAT32_COLS = {"prix_achat", "prix_vente", "prix_vente_unitaire", "prix_achat_unitaire", "cout_unitaire"}
+_CATEGORY_COLS = {"categorie", "type", "produit_nom"}
+_DATE_COLS = {"date"}
+
+def _typed_frame(columns, rows):
+    import pandas as pd
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    for col in columns:
+        if col in _DATE_COLS:
+            if pd.api.types.is_numeric_dtype(df[col]):  # numéro de jour (colonne jour lue telle quelle)
+                df[col] = pd.to_datetime(df[col], unit="D")
+            else:
+                df[col] = pd.to_datetime(df[col], format="%Y-%m-%d", errors="coerce")
+        elif col in _INT32_COLS:
+            df[col] = df[col].astype("Int32" if df[col].isna().any() else "int32")
+        elif col in _FLOAT32_COLS:
+            df[col] = df[col].astype("float32")
+        elif col in _CATEGORY_COLS:
+            df[col] = df[col].astype("category")
+    return df
+
+def query_df(sql, params=()):
+    """
+    Exécute une requête et construit directement un DataFrame typé à partir des tuples
+    (sans passer par sqlite3.Row ni par un dict par ligne) : date en datetime64 (texte ou numéro de jour),
+    identifiants et quantités en int32, prix unitaires en float32, libellés en category.
+    """
+    with _connect() as c:
+        cur = c.cursor()
+        cur.row_factory = None
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        return _typed_frame(columns, cur.fetchall())
+
+@cache.cached
+def get_produits_df():
+    return query_df("SELECT * FROM v_produits ORDER BY nom")
+
+@cache.cached
+def get_produits_sous_seuil_df():
+    return query_df(_SQL_SOUS_SEUIL, (SEUIL_ALERTE_DEFAUT, SEUIL_ALERTE_DEFAUT))
+
+@cache.cached
+def get_depenses_df(limit=500):
+    return query_df(f"SELECT {_colonnes('depenses', jour_brut=True)} FROM depenses_hist t "
+                    "ORDER BY t.jour DESC, t.id DESC LIMIT ?", (limit,))
+
+# ----------------- Résultats précalculés -----------------
+# Écrits par le scheduler : hors cache (invalidate=False), sinon chaque calcul viderait
+# le cache des lectures qu'il vient de remplir.
+def save_resultat(cle, contenu):
+    with transaction(invalidate=False) as c:
+        c.execute("INSERT INTO resultats_precalcules (cle, calcule_le, contenu) VALUES (?, ?, ?) "
+                  "ON CONFLICT(cle) DO UPDATE SET calcule_le = excluded.calcule_le, contenu = excluded.contenu",
+                  (cle, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), json.dumps(contenu)))
+
+def get_resultat(cle):
+    """Retourne (contenu, calcule_le), ou None si rien n'a encore été calculé pour cette clé."""
+    with _connect() as c:
+        row = c.execute("SELECT calcule_le, contenu FROM resultats_precalcules WHERE cle = ?", (cle,)).fetchone()
+    return None if row is None else (json.loads(row["contenu"]), row["calcule_le"])
+
+# ----------------- Prévisions de ventes -----------------
+# État du lissage exponentiel des ventes par produit (prevision.py), mis à jour jour par jour à partir
+# de daily_summary. previsions_etat.jour_calcule : dernier jour intégré ; jour_modifie : plus ancien jour
+# déjà intégré qui a reçu une vente depuis (l'état est alors recalculé). Les fonctions prennent la
+# connexion de la transaction de mise à jour (transaction) ou de lecture (lecture_coherente).
+def get_previsions_etat(c):
+    """(jour_calcule, jour_modifie), numéros de jour ou None."""
+    return tuple(c.execute("SELECT jour_calcule, jour_modifie FROM previsions_etat WHERE id = 1").fetchone())
+
+def get_previsions(c):
+    """Lignes (produit_id, niveau, variance, saison) par id croissant ; saison : 7 float64 (lundi d'abord)."""
+    cur = c.cursor()
+    cur.row_factory = None
+    return cur.execute("SELECT produit_id, niveau, variance, saison FROM previsions ORDER BY produit_id").fetchall()
+
+def get_qte_vendue_par_jour(c, jour_debut, jour_fin):
+    """(jour, produit_id, qte_vendue) de daily_summary entre deux numéros de jour inclus, par jour croissant."""
+    cur = c.cursor()
+    cur.row_factory = None
+    return cur.execute("""
+        SELECT jour, produit_id, qte_vendue FROM daily_summary
+        WHERE jour BETWEEN ? AND ? AND produit_id != 0 AND qte_vendue > 0
+        ORDER BY jour
+    """, (jour_debut, jour_fin)).fetchall()
+
+def save_previsions(c, jour_calcule, lignes):
+    """Remplace l'état (lignes comme get_previsions) ; à appeler dans la transaction qui l'a lu."""
+    c.execute("DELETE FROM previsions")
+    c.executemany("INSERT INTO previsions (produit_id, niveau, variance, saison) VALUES (?, ?, ?, ?)", lignes)
+    c.execute("UPDATE previsions_etat SET jour_calcule = ?, jour_modifie = NULL WHERE id = 1", (jour_calcule,))
+
+# ----------------- Archives -----------------
+# Une année close peut être déplacée dans archives/archive_<annee>.db : la base courante reste petite
+# (index et pages en cache). daily_summary garde les totaux de toutes les années, les rapports ne lisent
+# donc jamais les archives. Chaque connexion attache les archives (arch_<annee>) et définit les vues
+# temporaires ventes_hist, achats_hist, depenses_hist (base courante UNION ALL archives).
+ARCHIVE_TABLES = ("ventes", "achats", "depenses")
+MAX_ARCHIVES = 9  # SQLite attache au plus 10 bases par connexion
+
+def _archive_dir():
+    return os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), "archives")
+
+def _attach_archives(conn):
+    try:
+        archives = conn.execute("SELECT annee, fichier FROM archives ORDER BY annee").fetchall()
+    except sqlite3.OperationalError:
+        archives = []  # base pas encore initialisée
+    schemas = []
+    for annee, fichier in archives:
+        path = os.path.join(_archive_dir(), fichier)
+        if os.path.exists(path):  # ATTACH créerait une base vide
+            conn.execute(f"ATTACH DATABASE ? AS arch_{int(annee)}", (path,))
+            schemas.append(f"arch_{int(annee)}")
+    for t in ARCHIVE_TABLES:
+        conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS {t}_hist AS "
+                     + " UNION ALL ".join(f"SELECT * FROM {schema}.{t}" for schema in ["main"] + schemas))
+
+def _sources(c, date_from=None, date_to=None):
+    """Bases à interroger : main, puis les archives attachées (années décroissantes) qui recoupent la période."""
+    annees = sorted((int(r[1][5:]) for r in c.execute("PRAGMA database_list") if r[1].startswith("arch_")),
+                    reverse=True)
+    return ["main"] + [f"arch_{a}" for a in annees
+                       if (not date_from or date_from[:4] <= str(a)) and (not date_to or str(a) <= date_to[:4])]
+
+def archiver_annee(annee):
+    """
+    Déplace les ventes, achats et dépenses d'une année close dans archives/archive_<annee>.db.
+    Peut être relancé (lignes saisies après coup, interruption) : les lignes déjà copiées sont ignorées.
+    Retourne {table: lignes déplacées}.
+    """
+    annee = int(annee)
+    if annee >= datetime.now().year:
+        raise ValueError("Seule une année close (antérieure à l'année en cours) peut être archivée.")
+    if annee not in get_annees_archivables():
+        raise ValueError(f"Aucune vente, achat ou dépense de {annee} dans la base courante.")
+    schema, fichier = f"arch_{annee}", f"archive_{annee}.db"
+    debut, fin = _jour(f"{annee}-01-01"), _jour(f"{annee}-12-31")
+    os.makedirs(_archive_dir(), exist_ok=True)
+    conn = _new_conn()  # connexion dédiée : le pool est recyclé à la fin
+    try:
+        attachees = [r[1] for r in conn.execute("PRAGMA database_list") if r[1].startswith("arch_")]
+        if schema not in attachees:
+            if len(attachees) >= MAX_ARCHIVES:
+                raise ValueError(f"{MAX_ARCHIVES} archives au plus (limite d'ATTACH de SQLite).")
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (os.path.join(_archive_dir(), fichier),))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for t in ARCHIVE_TABLES:
+                # Même définition (et ordre des colonnes) que la table de la base courante
+                (sql,) = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                      (t,)).fetchone()
+                conn.execute(sql.replace("CREATE TABLE", f"CREATE TABLE IF NOT EXISTS {schema}.", 1))
+            _create_index_historique(conn, schema)
+            deplaces = {}
+            for t in ARCHIVE_TABLES:
+                conn.execute(f"INSERT OR IGNORE INTO {schema}.{t} SELECT * FROM main.{t} WHERE jour BETWEEN ? AND ?",
+                             (debut, fin))
+                deplaces[t] = conn.execute(f"DELETE FROM main.{t} WHERE jour BETWEEN ? AND ?", (debut, fin)).rowcount
+            conn.execute("""
+                INSERT INTO main.archives (annee, fichier, nb_ventes, nb_achats, nb_depenses, archive_le)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(annee) DO UPDATE SET nb_ventes = nb_ventes + excluded.nb_ventes,
+                    nb_achats = nb_achats + excluded.nb_achats, nb_depenses = nb_depenses + excluded.nb_depenses,
+                    archive_le = excluded.archive_le
+            """, (annee, fichier, deplaces["ventes"], deplaces["achats"], deplaces["depenses"],
+                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        conn.close()
+    close_all()  # les connexions rouvertes attachent la nouvelle archive
+    return deplaces
+
+@cache.cached
+def get_archives():
+    with _connect() as c:
+        return c.execute("SELECT * FROM archives ORDER BY annee").fetchall()
+
+@cache.cached
+def get_annees_archivables():
+    """Années closes ayant encore des lignes dans la base courante (recherches par l'index sur jour)."""
+    with _connect() as c:
+        (debut,) = c.execute("SELECT MIN(j) FROM (SELECT MIN(jour) AS j FROM ventes UNION ALL "
+                             "SELECT MIN(jour) FROM achats UNION ALL SELECT MIN(jour) FROM depenses)").fetchone()
+        if debut is None:
+            return []
+        return [a for a in range(int(_date_str(debut)[:4]), datetime.now().year)
+                if any(c.execute(f"SELECT 1 FROM {t} WHERE jour BETWEEN ? AND ? LIMIT 1",
+                                 (_jour(f"{a}-01-01"), _jour(f"{a}-12-31"))).fetchone() for t in ARCHIVE_TABLES)]
+
+# ----------------- Export / sauvegarde -----------------
+EXPORT_TABLES = ("produits", "ventes", "achats", "depenses")
+
+@contextmanager
+def lecture_coherente():
+    """
+    Connexion dans une transaction de lecture : en WAL, toutes les requêtes faites dessus voient
+    le même état de la base, même si des écritures sont validées pendant l'export.
+    """
+    with _connect() as c:
+        c.execute("BEGIN")
+        yield c  # _connect termine la transaction (ROLLBACK, rien n'a été écrit)
+
+def iter_export_rows(c, table, date_from=None, date_to=None, since_id=None, chunk_size=50000):
+    """
+    Lit une table par paquets de chunk_size lignes (ordre des id) : produit (colonnes, lignes).
+    Colonnes telles que lues par l'application (montants en dh, dates 'YYYY-MM-DD').
+    date_from / date_to : filtre sur la date (sauf produits) ; since_id : seulement les id > since_id.
+    Les archives concernées sont lues d'abord, de la plus ancienne à la plus récente.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table non exportable : {table}")
+    where, params = [], []
+    if date_from and table != "produits":
+        where.append("t.jour >= ?"); params.append(_jour(date_from))
+    if date_to and table != "produits":
+        where.append("t.jour <= ?"); params.append(_jour(date_to))
+    if since_id is not None:
+        where.append("t.id > ?"); params.append(since_id)
+    if table == "produits":
+        sources, select = ["main"], "SELECT * FROM {}.v_produits t"
+    else:
+        sources = _sources(c, date_from, date_to)[1:][::-1] + ["main"]
+        select = f"SELECT {_colonnes(table)} FROM {{}}.{table} t"
+    cur = c.cursor()
+    cur.row_factory = None
+    for schema in sources:
+        cur.execute(select.format(schema) + (f" WHERE {' AND '.join(where)}" if where else "")
+                    + " ORDER BY t.id", params)
+        columns = [d[0] for d in cur.description]
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield columns, rows
+
+def backup_to(dest_path):
+    """
+    Copie cohérente de la base en service (API de sauvegarde SQLite) dans dest_path, et de chaque archive
+    attachée dans archives/ à côté de dest_path (même disposition que la base : la copie se restaure telle
+    quelle, table archives comprise). Retourne la liste des fichiers écrits (base d'abord).
+    Chaque fichier est copié en une seule étape (pages=-1) dans la transaction de lecture de src : en WAL,
+    elle lit un seul instantané et ne bloque pas les caisses. Par paquets de pages, la copie recommencerait
+    à chaque COMMIT d'une autre connexion et n'aboutirait jamais sous un flux d'écritures continu.
+    """
+    fichiers = []
+    with lecture_coherente() as src:
+        archives = {f"arch_{int(r[0])}": r[1] for r in src.execute("SELECT annee, fichier FROM archives")}
+        schemas = ["main"] + [r[1] for r in src.execute("PRAGMA database_list") if r[1] in archives]
+        for schema in schemas:
+            src.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master").fetchone()  # instantané pris maintenant
+        for schema in schemas:
+            path = dest_path if schema == "main" else os.path.join(
+                os.path.dirname(os.path.abspath(dest_path)), "archives", archives[schema])
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            dst = sqlite3.connect(path)
+            try:
+                src.backup(dst, pages=-1, name=schema)
+                dst.execute("PRAGMA journal_mode=DELETE")  # fichier autonome, sans -wal à côté
+            finally:
+                dst.close()
+            fichiers.append(path)
+    return fichiers
+
+def get_export_etat():
+    """Dictionnaire table -> dernier id exporté."""
+    with _connect() as c:
+        return {r["nom_table"]: r["dernier_id"] for r in c.execute("SELECT nom_table, dernier_id FROM exports_etat")}
+
+def set_export_etat(derniers_ids):
+    with transaction(invalidate=False) as c:
+        c.executemany("INSERT INTO exports_etat (nom_table, dernier_id, exporte_le) VALUES (?, ?, ?) "
+                      "ON CONFLICT(nom_table) DO UPDATE SET dernier_id = excluded.dernier_id, "
+                      "exporte_le = excluded.exporte_le",
+                      [(t, i, datetime.now().strftime("%Y-%m-%d %H:%M:%S")) for t, i in derniers_ids.items()])
 
 # ----------------- Exports utilitaires -----------------
+# limit=-1 : pas de limite côté SQLite, aucune ligne n'est tronquée
 def get_all_produits_dict():
     return [dict(r) for r in get_produits()]
 
 def get_all_ventes_dict():
-    return [dict(r) for r in get_ventes(100000)]
+    return [dict(r) for r in get_ventes(-1)]
 
 def get_all_achats_dict():
-    return [dict(r) for r in get_achats(100000)]
+    return [dict(r) for r in get_achats(-1)]
 
 def get_all_depenses_dict():
-    return [dict(r) for r in get_depenses(100000)]
+    return [dict(r) for r in get_depenses(-1)]
 
 def reset_database(confirm=False):
     """
-    Supprime toutes les données (produits, ventes, achats, dépenses)
+    Supprime toutes les données (produits, ventes, achats, dépenses, archives)
     sans supprimer la structure des tables.
     Utiliser confirm=True pour exécuter réellement.
     """
@@ -235,15 +1443,46 @@ def reset_database(confirm=False):
         print("⚠️  Appel ignoré : utilisez reset_database(confirm=True) pour confirmer la suppression.")
         return
 
-    c = _get_conn()
-    cur = c.cursor()
-    cur.executescript("""
-        DELETE FROM ventes;
-        DELETE FROM achats;
-        DELETE FROM depenses;
-        DELETE FROM produits;
-        VACUUM;
-    """)
-    c.commit()
-    c.close()
-    print("✅ Base de données entièrement vidée.")
\ No newline at end of file
+    with transaction() as c:
+        c.execute("DELETE FROM ventes")
+        c.execute("DELETE FROM achats")
+        c.execute("DELETE FROM depenses")
+        c.execute("DELETE FROM produits")
+        c.execute("DELETE FROM daily_summary")
+        c.execute("DELETE FROM ticket_lignes")
+        c.execute("DELETE FROM tickets")
+        c.execute("DELETE FROM resultats_precalcules")
+        c.execute("DELETE FROM exports_etat")
+        c.execute("DELETE FROM previsions")
+        c.execute("UPDATE previsions_etat SET jour_calcule = NULL, jour_modifie = NULL")
+        fichiers = [r["fichier"] for r in c.execute("SELECT fichier FROM archives")]
+        c.execute("DELETE FROM archives")
+    close_all()  # détache les archives avant de supprimer les fichiers
+    for fichier in fichiers:
+        try:
+            os.remove(os.path.join(_archive_dir(), fichier))
+        except FileNotFoundError:
+            pass
+    # VACUUM ne peut pas s'exécuter dans une transaction
+    with _connect() as c:
+        c.execute("VACUUM")
+    print("✅ Base de données entièrement vidée.")
+
+if __name__ == "__main__":
+    import sys
+    # python db.py rebuild-summary : reconstruit daily_summary pour une base existante
+    # python db.py backfill-couts   : recalcule ventes.cout_unitaire manquants puis le résumé
+    if sys.argv[1:] == ["rebuild-summary"]:
+        init_db()
+        rebuild_daily_summary()
+        print("✅ daily_summary reconstruit.")
+    elif sys.argv[1:] == ["backfill-couts"]:
+        init_db()
+        print(f"✅ {backfill_couts_ventes()} ventes valorisées.")
+        rebuild_daily_summary()
+    elif len(sys.argv) == 3 and sys.argv[1] == "archive":
+        # python db.py archive 2023 : déplace l'année 2023 dans archives/archive_2023.db
+        init_db()
+        print(" | ".join(f"{t} : {n}" for t, n in archiver_annee(sys.argv[2]).items()))
+    else:
+        print("Usage : python db.py rebuild-summary | backfill-couts | archive <annee>")
@@ -0,0 +1,192 @@
+# exporter.py
+"""
+Export en flux des tables produits, ventes, achats et dépenses (CSV, NDJSON ou Parquet)
+et sauvegarde de la base en service.
+
+Chaque table est lue par paquets de CHUNK_SIZE lignes (db.iter_export_rows) et écrite au fur et à mesure :
+la mémoire reste bornée quelle que soit la taille de l'historique. Les quatre tables sont lues dans une
+même transaction de lecture (db.lecture_coherente), l'export est donc cohérent même pendant des saisies.
+
+Modes : complet, période (date_from / date_to) et incrémental (id > dernier id exporté, mémorisé dans
+db.exports_etat). En incrémental, produits est toujours exporté en entier : ses lignes sont modifiées
+(stock, prix moyen) et non seulement ajoutées.
+
+Parquet nécessite pyarrow (optionnel) : colonnes typées, compression zstd.
+"""
+import csv
+import json
+import os
+import tempfile
+import zipfile
+
+import db
+
+CHUNK_SIZE = 50000
+FORMATS = {"csv": ".csv", "ndjson": ".ndjson", "parquet": ".parquet"}
+
+# Types Parquet par nom de colonne (comme db._typed_frame) ; les autres colonnes sont du texte
+_FLOAT_COLS = {"prix_achat", "prix_vente", "prix_vente_unitaire", "prix_achat_unitaire", "cout_unitaire",
+               "total_revenu", "montant"}
+_DICT_COLS = {"categorie", "type"}
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        self._f = open(path, "w", encoding="utf-8", newline="")
+        self._w = csv.writer(self._f)
+        self._w.writerow(columns)
+
+    def write(self, columns, rows):
+        self._w.writerows(rows)
+
+    def close(self):
+        self._f.close()
+
+class _NdjsonWriter:
+    def __init__(self, path, columns):
+        self._f = open(path, "w", encoding="utf-8")
+
+    def write(self, columns, rows):
+        self._f.writelines(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows)
+
+    def close(self):
+        self._f.close()
+
+class _ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.compute as pc
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Le module pyarrow est requis pour l'export Parquet.")
+        self._pa, self._pc = pa, pc
+        self._types = [self._type(col) for col in columns]
+        self._schema = pa.schema(list(zip(columns, self._types)))
+        self._w = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def _type(self, col):
+        pa = self._pa
+        if col in db._INT32_COLS:
+            return pa.int32()
+        if col in _FLOAT_COLS:
+            return pa.float64()
+        if col in db._DATE_COLS:
+            return pa.date32()
+        if col in _DICT_COLS:
+            return pa.dictionary(pa.int32(), pa.string())
+        return pa.string()
+
+    def _array(self, values, typ):
+        pa, pc = self._pa, self._pc
+        if typ == pa.date32():
+            # Dates mal formées -> null plutôt qu'un export interrompu
+            return pc.strptime(pa.array(values, pa.string()), format="%Y-%m-%d", unit="s",
+                               error_is_null=True).cast(typ)
+        if pa.types.is_dictionary(typ):
+            return pa.array(values, pa.string()).dictionary_encode()
+        return pa.array(values, typ)
+
+    def write(self, columns, rows):
+        arrays = [self._array(list(col), typ) for col, typ in zip(zip(*rows), self._types)]
+        self._w.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._w.close()
+
+_WRITERS = {"csv": _CsvWriter, "ndjson": _NdjsonWriter, "parquet": _ParquetWriter}
+
+def export_table(c, table, path, fmt="csv", date_from=None, date_to=None, since_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Écrit une table dans path. c : connexion de db.lecture_coherente().
+    Retourne (nombre de lignes, dernier id exporté ou None si aucune ligne).
+    """
+    writer, nb, dernier_id = None, 0, None
+    try:
+        for columns, rows in db.iter_export_rows(c, table, date_from, date_to, since_id, chunk_size):
+            if writer is None:
+                writer = _WRITERS[fmt](path, columns)
+            writer.write(columns, rows)
+            nb += len(rows)
+            # Archives puis base courante : une archive peut contenir des id plus grands que ceux de main
+            dernier_id = max(rows[-1][columns.index("id")], dernier_id or 0)
+    finally:
+        if writer is not None:
+            writer.close()
+    return nb, dernier_id
+
+def export_all(dest_dir, fmt="csv", date_from=None, date_to=None, incremental=False, chunk_size=CHUNK_SIZE):
+    """
+    Exporte les quatre tables dans dest_dir (un fichier par table ayant des lignes).
+    incremental=True : seulement les lignes ajoutées depuis le dernier export incrémental,
+    dont la position est ensuite mémorisée. Retourne {table: nombre de lignes}.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Format inconnu : {fmt} ({', '.join(FORMATS)})")
+    os.makedirs(dest_dir, exist_ok=True)
+    etat = db.get_export_etat() if incremental else {}
+    resultat, derniers_ids = {}, {}
+    with db.lecture_coherente() as c:
+        for table in db.EXPORT_TABLES:
+            since_id = etat.get(table) if table != "produits" else None
+            path = os.path.join(dest_dir, table + FORMATS[fmt])
+            nb, dernier_id = export_table(c, table, path, fmt, date_from, date_to, since_id, chunk_size)
+            resultat[table] = nb
+            if dernier_id is not None and table != "produits":
+                derniers_ids[table] = dernier_id
+    if incremental and derniers_ids:
+        db.set_export_etat(derniers_ids)
+    return resultat
+
+def export_zip(zip_path, fmt="csv", **kwargs):
+    """Comme export_all, puis regroupe les fichiers dans une archive zip (téléchargement)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        resultat = export_all(tmp, fmt, **kwargs)
+        # Parquet est déjà compressé : stocké tel quel
+        compression = zipfile.ZIP_STORED if fmt == "parquet" else zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(zip_path, "w", compression) as zf:
+            for name in sorted(os.listdir(tmp)):
+                zf.write(os.path.join(tmp, name), name)
+    return resultat
+
+def backup_zip(zip_path):
+    """
+    db.backup_to regroupé dans une archive zip (téléchargement) : la base sous son nom (data.db) et les
+    archives par année dans archives/, à décompresser dans le dossier de l'application pour restaurer.
+    Retourne les noms des fichiers de l'archive.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        fichiers = db.backup_to(os.path.join(tmp, os.path.basename(db.DB_FILE)))
+        noms = [os.path.relpath(f, tmp).replace(os.sep, "/") for f in fichiers]
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for f, nom in zip(fichiers, noms):
+                zf.write(f, nom)
+    return noms
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export en flux et sauvegarde de la base.")
+    parser.add_argument("dest", help="Dossier (ou fichier .zip) de destination ; fichier .db ou .zip avec --backup")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv")
+    parser.add_argument("--from", dest="date_from", help="Date de début (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Date de fin (YYYY-MM-DD)")
+    parser.add_argument("--incremental", action="store_true", help="Seulement les lignes depuis le dernier export")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--backup", action="store_true",
+                        help="Copie cohérente de la base et de ses archives (API de sauvegarde)")
+    parser.add_argument("--db", default=db.DB_FILE)
+    args = parser.parse_args()
+
+    db.DB_FILE = args.db
+    db.init_db()
+    if args.backup:
+        fichiers = backup_zip(args.dest) if args.dest.endswith(".zip") else db.backup_to(args.dest)
+        print(f"✅ Sauvegarde écrite dans {args.dest} : " + ", ".join(fichiers))
+    else:
+        options = dict(date_from=args.date_from, date_to=args.date_to, incremental=args.incremental,
+                       chunk_size=args.chunk_size)
+        if args.dest.endswith(".zip"):
+            resultat = export_zip(args.dest, args.format, **options)
+        else:
+            resultat = export_all(args.dest, args.format, **options)
+        print(" | ".join(f"{t} : {n}" for t, n in resultat.items()))
@@ -0,0 +1,156 @@
+# importer.py
+"""
+Import en flux de fichiers CSV / Excel (ventes ou achats).
+
+Le fichier est lu ligne à ligne, validé, puis envoyé à db.add_ventes_bulk / db.add_achats_bulk
+par paquets de CHUNK_SIZE lignes : la mémoire reste bornée quelle que soit la taille du fichier
+et chaque paquet est une transaction courte qui ne bloque pas les caisses.
+
+Colonnes attendues (en-tête, insensible à la casse) :
+    produit (nom) ou produit_id, quantite, prix_unitaire, date (YYYY-MM-DD, optionnelle)
+"""
+import csv
+import io
+import math
+from datetime import date, datetime
+
+import db
+
+CHUNK_SIZE = 5000
+MAX_ERREURS = 100  # messages d'erreur conservés
+
+# Noms de colonnes acceptés -> nom interne
+_ALIASES = {
+    "produit": "produit", "nom": "produit", "produit_nom": "produit",
+    "produit_id": "produit_id", "id_produit": "produit_id",
+    "quantite": "quantite", "quantité": "quantite", "qte": "quantite",
+    "prix_unitaire": "prix", "prix": "prix",
+    "prix_vente_unitaire": "prix", "prix_achat_unitaire": "prix",
+    "date": "date",
+}
+
+def iter_csv_rows(fileobj):
+    """Lit un CSV (séparateur ',' ou ';', UTF-8 avec ou sans BOM) et produit des dicts."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    first = text.readline()
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    header = next(csv.reader([first], delimiter=delimiter), [])
+    try:
+        for values in csv.reader(text, delimiter=delimiter):
+            if values:
+                yield dict(zip(header, values))
+    finally:
+        text.detach()  # ne pas fermer le fichier de l'appelant
+
+def iter_xlsx_rows(fileobj):
+    """Lit la première feuille d'un classeur .xlsx en mode lecture seule (flux)."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("Le module openpyxl est requis pour importer des fichiers Excel.")
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, ())]
+        for values in rows:
+            if any(v is not None for v in values):
+                yield dict(zip(header, values))
+    finally:
+        wb.close()
+
+def iter_file_rows(fileobj, filename):
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_rows(fileobj)
+    return iter_csv_rows(fileobj)
+
+def _normalize(row):
+    return {_ALIASES[k.strip().lower()]: v for k, v in row.items()
+            if k and k.strip().lower() in _ALIASES}
+
+def _parse_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.isoformat()
+    return date.fromisoformat(str(value).strip()[:10]).isoformat()
+
+def _parse_number(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(str(value).strip().replace(" ", "").replace(",", "."))
+
+def parse_row(row, prod_ids, known_ids):
+    """
+    Valide une ligne normalisée et retourne (produit_id, quantite, prix_unitaire, date_str).
+    Lève ValueError avec un message lisible si la ligne est invalide.
+    """
+    if row.get("produit_id") not in (None, ""):
+        try:
+            pid = int(_parse_number(row["produit_id"]))
+        except (TypeError, ValueError, OverflowError):  # texte, nan, inf
+            raise ValueError(f"produit_id invalide : {row['produit_id']}")
+        if pid not in known_ids:
+            raise ValueError(f"produit_id {pid} inconnu")
+    else:
+        nom = str(row.get("produit") or "").strip()
+        if not nom:
+            raise ValueError("produit manquant")
+        if nom not in prod_ids:
+            raise ValueError(f"produit '{nom}' inconnu")
+        pid = prod_ids[nom]
+    try:
+        qte = _parse_number(row.get("quantite"))
+        prix = _parse_number(row.get("prix"))
+    except (TypeError, ValueError):
+        raise ValueError("quantité ou prix invalide")
+    # Mêmes règles que api.py : nan, inf et valeurs hors bornes refusés ici, ligne par ligne,
+    # plutôt que de faire échouer la transaction du paquet entier dans db.add_*_bulk
+    if not math.isfinite(qte) or not (0 < qte <= db.MAX_QUANTITE) or qte != int(qte):
+        raise ValueError(f"quantité invalide : {row.get('quantite')}")
+    if not math.isfinite(prix):
+        raise ValueError(f"prix invalide : {row.get('prix')}")
+    if prix < 0:
+        raise ValueError(f"prix négatif : {row.get('prix')}")
+    if prix > db.MAX_MONTANT:
+        raise ValueError(f"prix trop élevé : {row.get('prix')}")
+    try:
+        date_str = _parse_date(row.get("date"))
+    except ValueError:
+        raise ValueError(f"date invalide : {row.get('date')}")
+    return pid, int(qte), prix, date_str
+
+def import_rows(rows, kind, chunk_size=CHUNK_SIZE, on_progress=None):
+    """
+    Valide et importe un itérable de dicts. kind : "ventes" ou "achats".
+    Les lignes invalides sont ignorées et signalées.
+    Retourne (nb_importees, nb_rejetees, erreurs) ;
+    erreurs = les MAX_ERREURS premiers (numéro de ligne, message).
+    """
+    bulk = {"ventes": db.add_ventes_bulk, "achats": db.add_achats_bulk}[kind]
+    prod_ids = db.get_produit_ids_by_nom()
+    known_ids = set(prod_ids.values())
+    nb, nb_rejetees, erreurs, chunk = 0, 0, [], []
+    for num, row in enumerate(rows, start=2):  # ligne 1 = en-tête
+        try:
+            chunk.append(parse_row(_normalize(row), prod_ids, known_ids))
+        except ValueError as e:
+            nb_rejetees += 1
+            if len(erreurs) < MAX_ERREURS:
+                erreurs.append((num, str(e)))
+            continue
+        if len(chunk) >= chunk_size:
+            nb += bulk(chunk)
+            chunk = []
+            if on_progress:
+                on_progress(nb)
+    if chunk:
+        nb += bulk(chunk)
+        if on_progress:
+            on_progress(nb)
+    return nb, nb_rejetees, erreurs
+
+def import_file(fileobj, filename, kind, chunk_size=CHUNK_SIZE, on_progress=None):
+    """Importe un fichier CSV ou XLSX de ventes / achats. Voir import_rows."""
+    return import_rows(iter_file_rows(fileobj, filename), kind, chunk_size, on_progress)
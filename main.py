@@ -1,34 +1,126 @@
 # main.py
+# pandas, plotly et reporting (numpy) sont importés dans les pages qui s'en servent :
+# le titre et la navigation s'affichent avant leur chargement.
+import time
+run_t0 = time.perf_counter()
+
+import os
+import tempfile
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 from datetime import date, timedelta
 
+import cache
 import db
+import exporter
+import importer
+import perf
+import scheduler
 import utils
 
+perf.record_section("demarrage.imports", run_t0)
 st.set_page_config(page_title="Gestionnaire Ventes & Stocks", layout="wide")
 st.title("Gestionnaire de ventes & stocks — dh")
 
-# --- Initialisation DB ---
-db.init_db()
-LOW_STOCK_THRESHOLD = 5  # seuil fixe
+# --- Initialisation (une fois par processus, pas à chaque rerun) ---
+@st.cache_resource(show_spinner=False)
+def demarrage():
+    t0 = time.perf_counter()
+    db.init_db()
+    scheduler.start()  # rapports et alertes stock précalculés en arrière-plan (un thread par processus)
+    perf.record_section("demarrage.init_db", t0)
+
+demarrage()
 
 # --- Helpers ---
-def rows_to_df(rows):
-    if not rows:
-        return pd.DataFrame()
-    return pd.DataFrame([dict(r) for r in rows])
+def import_section(kind):
+    """Import en flux d'un fichier CSV / Excel de ventes ou d'achats."""
+    with st.expander(f"📄 Importer des {kind} (CSV / Excel)"):
+        st.caption("Colonnes : produit (ou produit_id), quantite, prix_unitaire, date (YYYY-MM-DD, optionnelle).")
+        fichier = st.file_uploader("Fichier", type=["csv", "xlsx"], key=f"import_{kind}")
+        if fichier is not None and st.button("Importer", key=f"btn_import_{kind}"):
+            progress = st.empty()
+            try:
+                nb, nb_rejetees, erreurs = importer.import_file(
+                    fichier, fichier.name, kind,
+                    on_progress=lambda n: progress.info(f"{n} lignes importées…"))
+            except RuntimeError as e:
+                st.error(str(e))
+                return
+            progress.success(f"{nb} lignes importées.")
+            if nb_rejetees:
+                st.warning(f"{nb_rejetees} lignes ignorées.")
+                st.dataframe([{"ligne": ligne, "erreur": erreur} for ligne, erreur in erreurs])
+
+def produit_selector(label, key, tous=False, limit=20):
+    """
+    Sélecteur avec recherche incrémentale : seuls les produits correspondant au texte saisi
+    (au plus limit) sont chargés, quelle que soit la taille du catalogue.
+    Retourne la ligne produit choisie, ou None ("Tous" / aucun résultat).
+    """
+    texte = st.text_input(f"🔎 {label}", key=f"{key}_q", placeholder="Début du nom ou de la catégorie")
+    rows = {r["id"]: r for r in db.search_produits(texte, limit)}
+    options = ([None] if tous else []) + list(rows)
+    if not options:
+        st.caption("Aucun produit trouvé.")
+        return None
+    pid = st.selectbox(label, options, key=f"{key}_sel",
+                       format_func=lambda i: "Tous" if i is None else
+                       f"{rows[i]['nom']} — {rows[i]['categorie'] or 'sans catégorie'} (stock {rows[i]['stock']})")
+    return rows.get(pid)
+
+def history_section(kind, fetch_page, page_size=50):
+    """
+    Historique paginé (ventes / achats) : filtres appliqués côté serveur,
+    pagination par curseur conservée dans st.session_state.
+    """
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        produit = produit_selector("Produit", key=f"hist_{kind}_produit", tous=True)
+    categorie = f2.selectbox("Catégorie", ["Toutes"] + db.get_categories(), key=f"hist_{kind}_cat")
+    du = f3.date_input("Du", value=None, key=f"hist_{kind}_du")
+    au = f4.date_input("Au", value=None, key=f"hist_{kind}_au")
+    filtres = {
+        "produit_id": produit["id"] if produit else None,
+        "categorie": None if categorie == "Toutes" else categorie,
+        "date_from": du.strftime("%Y-%m-%d") if du else None,
+        "date_to": au.strftime("%Y-%m-%d") if au else None,
+    }
+
+    # Pile des curseurs des pages visitées ; remise à zéro si les filtres changent
+    state = st.session_state.setdefault(f"hist_{kind}", {"filtres": filtres, "cursors": [None]})
+    if state["filtres"] != filtres:
+        state["filtres"], state["cursors"] = filtres, [None]
+
+    with perf.section(f"{kind}.historique"):
+        df, next_cursor = fetch_page(cursor=state["cursors"][-1], limit=page_size, as_df=True, **filtres)
+    st.dataframe(df)
+
+    p1, p2, p3 = st.columns([1, 1, 4])
+    if p1.button("◀ Précédent", key=f"hist_{kind}_prev", disabled=len(state["cursors"]) == 1):
+        state["cursors"].pop()
+        st.rerun()
+    if p2.button("Suivant ▶", key=f"hist_{kind}_next", disabled=next_cursor is None):
+        state["cursors"].append(next_cursor)
+        st.rerun()
+    p3.caption(f"Page {len(state['cursors'])}")
+
+@st.cache_data(max_entries=32)
+def ca_figure(ca_by_day):
+    """Graphique CA par jour, reconstruit seulement si les données changent."""
+    import plotly.express as px
+    return px.bar(ca_by_day, x="date", y="ca", labels={"ca": "CA (dh)", "date": "Date"})
 
 # Initialisation de l'état de session pour la suppression
 if 'delete_confirm_id' not in st.session_state:
     st.session_state['delete_confirm_id'] = None
+st.session_state['perf_reruns'] = st.session_state.get('perf_reruns', 0) + 1
     
 # --- Sidebar navigation ---
 page = st.sidebar.selectbox(
     "Navigation",
     ["Tableau de bord", "Produits", "Ventes", "Achats", "Dépenses", "Paramètres"]
 )
+page_t0 = time.perf_counter()
 
 # ---------- PRODUITS ----------
 if page == "Produits":
@@ -55,27 +147,21 @@ if page == "Produits":
     # --- Catalogue et suppression ---
     with col2:
         st.subheader("Catalogue")
-        prods = db.get_produits()
-        dfp = rows_to_df(prods)
+        dfp = db.get_produits_df()
 
         if dfp.empty:
             st.info("Aucun produit enregistré.")
         else:
-            dfp["alerte_stock"] = dfp["stock"] <= LOW_STOCK_THRESHOLD
-            st.dataframe(dfp[["id","nom","categorie","stock","prix_achat","prix_vente","total_vendu","total_revenu","alerte_stock"]], height=420)
+            sous_seuil = [r["id"] for r in db.get_produits_sous_seuil()]
+            dfp = dfp.assign(alerte_stock=dfp["id"].isin(sous_seuil))  # copie : dfp est en cache
+            st.dataframe(dfp[["id","nom","categorie","stock","prix_achat","prix_vente","total_vendu","total_revenu","seuil_alerte","alerte_stock"]], height=420)
 
         st.markdown("---")
         st.markdown("**Suppression de produit**")
         
-        if prods:
-            prod_ids = [p["id"] for p in prods]
-            
-            # Sélection du produit
-            sel = st.selectbox("Sélectionner produit (ID)", 
-                               options=prod_ids, 
-                               format_func=lambda x: f"{x} — {db.get_produit_by_id(x)['nom']}",
-                               key="prod_select_delete"
-                              )
+        produit_sel = None if dfp.empty else produit_selector("Sélectionner produit", key="prod_select_delete")
+        if produit_sel is not None:
+            sel = produit_sel["id"]
 
             # Logique de confirmation de suppression
             if st.session_state['delete_confirm_id'] == sel:
@@ -108,46 +194,74 @@ if page == "Produits":
 # ---------- VENTES ----------
 elif page == "Ventes":
     st.header("💰 Enregistrer une vente")
-    prods = db.get_produits()
-    if not prods:
+    panier = st.session_state.setdefault("panier", [])
+    if not db.search_produits("", 1):
         st.info("Pas de produit disponible, ajoutez d'abord.")
     else:
-        prod_map = {p["nom"]: p["id"] for p in prods}
-        choix = st.selectbox("Produit", list(prod_map.keys()))
-        qte = st.number_input("Quantité vendue", min_value=1, value=1, step=1)
-        prix = st.number_input("Prix unitaire (dh)", min_value=0.0, value=0.0, format="%.2f")
-        date_input = st.date_input("Date de vente", value=date.today())
-        if st.button("Ajouter la vente"):
-            pid = prod_map[choix]
-            db.add_vente(pid, int(qte), float(prix), date_input.strftime("%Y-%m-%d"))
-            st.success(f"Vente : {qte} × {choix} enregistrée.")
-            st.rerun()
+        choix = produit_selector("Produit", key="vente_produit")
+        # Le formulaire ne relance pas la page à chaque saisie ; rien n'est écrit avant la validation
+        with st.form("form_panier", clear_on_submit=True):
+            qte = st.number_input("Quantité vendue", min_value=1, value=1, step=1)
+            prix = st.number_input("Prix unitaire (dh)", min_value=0.0, value=0.0, format="%.2f")
+            if st.form_submit_button("➕ Ajouter au panier", disabled=choix is None):
+                panier.append({"produit_id": choix["id"], "produit": choix["nom"],
+                               "quantite": int(qte), "prix": float(prix)})
+
+        st.subheader("🧺 Panier")
+        if not panier:
+            st.caption("Panier vide.")
+        else:
+            st.dataframe([{"produit": l["produit"], "quantite": l["quantite"], "prix": l["prix"],
+                           "total": l["quantite"] * l["prix"]} for l in panier])
+            st.markdown(f"**Total : {sum(l['quantite'] * l['prix'] for l in panier):.2f} dh**")
+            date_input = st.date_input("Date de vente", value=date.today())
+            check_stock = st.checkbox("Refuser la vente si le stock est insuffisant", key="vente_check_stock")
+            b1, b2 = st.columns(2)
+            if b1.button("💳 Valider le ticket"):
+                try:
+                    ticket_id = db.add_ticket([(l["produit_id"], l["quantite"], l["prix"]) for l in panier],
+                                              date_input.strftime("%Y-%m-%d"), check_stock=check_stock)
+                except db.StockInsuffisantError as e:
+                    st.error(str(e))
+                else:
+                    st.session_state["panier"] = []
+                    st.success(f"Ticket n° {ticket_id} enregistré ({len(panier)} lignes).")
+                    st.rerun()
+            if b2.button("🗑️ Vider le panier"):
+                st.session_state["panier"] = []
+                st.rerun()
+        import_section("ventes")
     st.markdown("---")
-    st.subheader("Ventes récentes")
-    ventes = db.get_ventes(limit=200)
-    st.dataframe(rows_to_df(ventes))
+    st.subheader("🧾 Derniers tickets")
+    tickets = db.get_tickets(20)
+    if not tickets:
+        st.caption("Aucun ticket enregistré.")
+    else:
+        st.dataframe([dict(t) for t in tickets])
+        ticket_sel = st.selectbox("Détail du ticket", [t["id"] for t in tickets], key="ticket_detail")
+        st.dataframe([{k: l[k] for k in ("produit_nom", "quantite", "prix_vente_unitaire", "vente_id")}
+                      for l in db.get_ticket_lignes(ticket_sel)])
+    st.subheader("Historique des ventes")
+    history_section("ventes", db.get_ventes_page)
 
 # ---------- ACHATS ----------
 elif page == "Achats":
     st.header("📥 Enregistrer un achat / approvisionnement")
-    prods = db.get_produits()
-    if not prods:
+    if not db.search_produits("", 1):
         st.info("Pas de produit disponible, ajoutez d'abord.")
     else:
-        prod_map = {p["nom"]: p["id"] for p in prods}
-        choix = st.selectbox("Produit", list(prod_map.keys()))
+        choix = produit_selector("Produit", key="achat_produit")
         qte = st.number_input("Quantité achetée", min_value=1, value=1, step=1)
         prix = st.number_input("Prix d'achat unitaire (dh)", min_value=0.0, value=0.0, format="%.2f")
         date_input = st.date_input("Date d'achat", value=date.today())
-        if st.button("Ajouter l'achat"):
-            pid = prod_map[choix]
-            db.add_achat(pid, int(qte), float(prix), date_input.strftime("%Y-%m-%d"))
-            st.success(f"Achat : {qte} × {choix} ajouté.")
+        if st.button("Ajouter l'achat", disabled=choix is None):
+            db.add_achat(choix["id"], int(qte), float(prix), date_input.strftime("%Y-%m-%d"))
+            st.success(f"Achat : {qte} × {choix['nom']} ajouté.")
             st.rerun()
+        import_section("achats")
     st.markdown("---")
-    st.subheader("Achats récents")
-    achats = db.get_achats(limit=200)
-    st.dataframe(rows_to_df(achats))
+    st.subheader("Historique des achats")
+    history_section("achats", db.get_achats_page)
 
 # ---------- DEPENSES ----------
 elif page == "Dépenses":
@@ -162,27 +276,23 @@ elif page == "Dépenses":
         st.rerun()
     st.markdown("---")
     st.subheader("Dépenses récentes")
-    deps = db.get_depenses(limit=200)
-    st.dataframe(rows_to_df(deps))
+    st.dataframe(db.get_depenses_df(limit=200))
 
 # ---------- TABLEAU DE BORD ----------
 elif page == "Tableau de bord":
     st.header("📊 Tableau de bord")
     view = st.radio("Période", ["Jour", "Semaine", "Mois", "Personnalisée"], horizontal=True)
     today = date.today()
+    periodes = scheduler.periodes(today)  # mêmes périodes que les rapports précalculés
     if view == "Jour":
         d = st.date_input("Date", value=today)
         from_date = to_date = d
     elif view == "Semaine":
-        start_of_week = today - timedelta(days=today.weekday())
-        from_date = st.date_input("Début semaine", value=start_of_week)
-        to_date = st.date_input("Fin semaine", value=start_of_week + timedelta(days=6))
+        from_date = st.date_input("Début semaine", value=periodes["semaine"][0])
+        to_date = st.date_input("Fin semaine", value=periodes["semaine"][1])
     elif view == "Mois":
-        first = today.replace(day=1)
-        from_date = st.date_input("Début mois", value=first)
-        next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
-        last = next_month - timedelta(days=1)
-        to_date = st.date_input("Fin mois", value=last)
+        from_date = st.date_input("Début mois", value=periodes["mois"][0])
+        to_date = st.date_input("Fin mois", value=periodes["mois"][1])
     else:
         from_date = st.date_input("De", value=today - timedelta(days=7))
         to_date = st.date_input("À", value=today)
@@ -190,7 +300,10 @@ elif page == "Tableau de bord":
     if from_date > to_date:
         st.error("La date de début doit être inférieure ou égale à la date de fin.")
     else:
-        rpt = utils.compute_report(from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d"))
+        with perf.section("Tableau de bord.rapport"):
+            # Période par défaut : résultat du scheduler ; autre période ou écriture récente : calcul direct
+            rpt = (scheduler.rapport_precalcule(from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d"))
+                   or utils.compute_report(from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d")))
         c1, c2, c3 = st.columns(3)
         c1.metric("📈 CA", f"{rpt['ca']:.2f} dh")
         c2.metric("📉 Coût achats", f"{rpt['cout_achat']:.2f} dh")
@@ -198,25 +311,185 @@ elif page == "Tableau de bord":
         st.metric("🟢 Bénéfice net", f"{rpt['profit']:.2f} dh")
 
         st.subheader("Top produits (par quantité vendue)")
-        df_top = pd.DataFrame(rpt["top"])
-        if df_top.empty:
+        if not rpt["top"]:
             st.info("Aucune vente dans la période.")
         else:
-            st.dataframe(df_top.head(10))
+            st.dataframe(rpt["top"][:10])
 
         st.subheader("CA par jour")
-        df_ca = pd.DataFrame(rpt["ca_by_day"])
-        if not df_ca.empty:
-            fig = px.bar(df_ca, x="date", y="ca", labels={"ca": "CA (dh)", "date": "Date"})
-            st.plotly_chart(fig, use_container_width=True)
+        if rpt["ca_by_day"]:
+            with perf.section("Tableau de bord.graphique"):
+                st.plotly_chart(ca_figure(rpt["ca_by_day"]), use_container_width=True)
 
-        st.subheader(f"Alerte stock faible (≤ {LOW_STOCK_THRESHOLD} unités)")
-        low = db.get_produits_stock_below(LOW_STOCK_THRESHOLD)
-        st.dataframe(rows_to_df(low))
+        st.subheader("Marges par période et par produit")
+        import reporting  # numpy / pandas : chargés seulement pour cette section
+        freq = st.radio("Granularité", list(reporting.FREQS), format_func=reporting.FREQS.get, horizontal=True)
+        with perf.section("Tableau de bord.marges"):
+            detail = reporting.report_from_db(from_date.strftime("%Y-%m-%d"), to_date.strftime("%Y-%m-%d"), freq)
+        if detail["top"]:
+            st.dataframe(detail["ca_by_period"])
+            st.dataframe(sorted(detail["top"], key=lambda t: t["marge"], reverse=True)[:20])
+
+        st.subheader("Alerte stock faible (stock ≤ seuil du produit ou de sa catégorie)")
+        with perf.section("Tableau de bord.stock faible"):
+            pre = scheduler.stock_faible_precalcule()
+            if pre is not None:
+                st.dataframe(pre[0])
+                st.caption(f"Calculé en arrière-plan le {pre[1]}.")
+            else:
+                st.dataframe(db.get_produits_sous_seuil_df())
+
+        st.subheader("📦 Prévisions et réapprovisionnement")
+        with perf.section("Tableau de bord.prévisions"):
+            import prevision  # numpy, chargé au premier affichage du tableau de bord
+            a_commander = [s for s in prevision.suggestions(date.today().isoformat()) if s["a_commander"]]
+        st.caption(f"Vitesse de vente lissée (par jour de semaine), délai de réapprovisionnement de "
+                   f"{prevision.DELAI_JOURS} jours : commande suggérée quand le stock ne couvre plus le délai "
+                   f"et la marge de sécurité.")
+        if a_commander:
+            st.dataframe(a_commander)
+            choix_cmd = st.multiselect("Produits à commander", [s["nom"] for s in a_commander],
+                                       default=[s["nom"] for s in a_commander], key="prev_commande")
+            if st.button("🛒 Enregistrer les achats suggérés", key="btn_commander", disabled=not choix_cmd):
+                n = prevision.commander([s for s in a_commander if s["nom"] in choix_cmd])
+                st.success(f"{n} achat(s) enregistré(s) au prix d'achat moyen.")
+        else:
+            st.info("Aucun produit à commander.")
 
 elif page == "Paramètres":
     st.title("⚙️ Paramètres et maintenance")
 
+    st.subheader("Résumés journaliers")
+    st.caption("Le tableau de bord lit une table de résumés par jour et par produit, mise à jour à chaque saisie.")
+    if st.button("🔄 Reconstruire les résumés à partir de l'historique"):
+        db.rebuild_daily_summary()
+        st.success("Résumés journaliers reconstruits.")
+
+    st.markdown("---")
+    st.subheader("🔔 Seuils d'alerte stock")
+    st.caption(f"Seuil du produit s'il est défini, sinon celui de sa catégorie, sinon {db.SEUIL_ALERTE_DEFAUT} unités.")
+    s1, s2 = st.columns(2)
+    with s1:
+        st.markdown("**Par catégorie**")
+        seuils = db.get_seuils_categorie()
+        if seuils:
+            st.dataframe([{"categorie": cat, "seuil": seuil} for cat, seuil in seuils.items()])
+        cat = st.selectbox("Catégorie", db.get_categories(), key="seuil_cat")
+        seuil_cat = st.number_input("Seuil", min_value=0, value=seuils.get(cat, db.SEUIL_ALERTE_DEFAUT),
+                                    step=1, key="seuil_cat_val")
+        b1, b2 = st.columns(2)
+        if b1.button("Enregistrer", key="btn_seuil_cat", disabled=cat is None):
+            db.set_seuil_categorie(cat, seuil_cat)
+            st.rerun()
+        if b2.button("Retirer", key="btn_seuil_cat_del", disabled=cat not in seuils):
+            db.set_seuil_categorie(cat, None)
+            st.rerun()
+    with s2:
+        st.markdown("**Par produit**")
+        produit = produit_selector("Produit", key="seuil_produit")
+        if produit is not None:
+            seuil_prod = st.number_input("Seuil", min_value=0, step=1, key=f"seuil_prod_val_{produit['id']}",
+                                         value=produit["seuil_alerte"] if produit["seuil_alerte"] is not None
+                                         else db.SEUIL_ALERTE_DEFAUT)
+            b1, b2 = st.columns(2)
+            if b1.button("Enregistrer", key="btn_seuil_prod"):
+                db.set_seuil_produit(produit["id"], seuil_prod)
+                st.rerun()
+            if b2.button("Retirer", key="btn_seuil_prod_del", disabled=produit["seuil_alerte"] is None):
+                db.set_seuil_produit(produit["id"], None)
+                st.rerun()
+
+    etat = scheduler.etat()
+    st.caption(f"Calcul en arrière-plan {'actif' if etat['actif'] else 'arrêté'}"
+               + (f", dernier passage le {etat['calcule_le']} ({etat['ms']:.0f} ms)" if etat["calcule_le"] else "")
+               + (f" — erreur : {etat['erreur']}" if etat["erreur"] else "")
+               + (f". Alertes ajoutées à {scheduler.ALERT_FILE}." if scheduler.ALERT_FILE else "."))
+
+    st.markdown("---")
+    st.subheader("🗃️ Archives")
+    st.caption("Une année close est déplacée dans archives/archive_<année>.db. Les totaux restent dans les "
+               "résumés journaliers ; l'historique et les exports lisent les archives automatiquement.")
+    archives = db.get_archives()
+    if archives:
+        st.dataframe([dict(r) for r in archives])
+    annees = db.get_annees_archivables()
+    if annees:
+        annee = st.selectbox("Année à archiver", annees, key="archive_annee")
+        if st.button("📦 Archiver l'année", key="btn_archive"):
+            try:
+                deplaces = db.archiver_annee(annee)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.success(" | ".join(f"{t} : {n} lignes archivées" for t, n in deplaces.items()))
+    else:
+        st.caption("Aucune année close à archiver.")
+
+    st.markdown("---")
+    st.subheader("💾 Export et sauvegarde")
+    st.caption("Produits, ventes, achats et dépenses, lus par paquets dans un état cohérent de la base.")
+    e1, e2 = st.columns(2)
+    fmt = e1.selectbox("Format", list(exporter.FORMATS), key="export_fmt")
+    mode = e2.radio("Lignes", ["Tout", "Période", "Depuis le dernier export"], key="export_mode", horizontal=True)
+    options = {}
+    if mode == "Période":
+        du = e1.date_input("Du", value=date.today().replace(day=1), key="export_du")
+        au = e2.date_input("Au", value=date.today(), key="export_au")
+        options = {"date_from": du.strftime("%Y-%m-%d"), "date_to": au.strftime("%Y-%m-%d")}
+    elif mode == "Depuis le dernier export":
+        options = {"incremental": True}
+        st.caption("La table produits est toujours exportée en entier ; la position est mémorisée à la préparation.")
+    b1, b2 = st.columns(2)
+    if b1.button("📦 Préparer l'export", key="btn_export"):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "export.zip")
+            try:
+                resultat = exporter.export_zip(path, fmt, **options)
+            except RuntimeError as e:
+                st.error(str(e))
+            else:
+                st.caption(" | ".join(f"{t} : {n} lignes" for t, n in resultat.items()))
+                with open(path, "rb") as f:
+                    st.download_button("⬇️ Télécharger l'export", f.read(), mime="application/zip",
+                                       file_name=f"export_{fmt}_{date.today():%Y%m%d}.zip")
+    if b2.button("🗄️ Préparer une sauvegarde de la base", key="btn_backup"):
+        with tempfile.TemporaryDirectory() as tmp:
+            if db.get_archives():  # base + archives par année : un seul zip
+                path = os.path.join(tmp, "sauvegarde.zip")
+                fichiers = exporter.backup_zip(path)
+                st.caption(f"Contenu : {', '.join(fichiers)} (à décompresser dans le dossier de l'application)")
+                mime, nom = "application/zip", f"sauvegarde_{date.today():%Y%m%d}.zip"
+            else:
+                path = os.path.join(tmp, "sauvegarde.db")
+                db.backup_to(path)
+                mime, nom = "application/x-sqlite3", f"sauvegarde_{date.today():%Y%m%d}.db"
+            with open(path, "rb") as f:
+                st.download_button("⬇️ Télécharger la sauvegarde", f.read(), mime=mime, file_name=nom)
+
+    st.markdown("---")
+    if st.checkbox("Afficher le panneau de performance", key="perf_panel"):
+        st.subheader("⏱️ Performance")
+        stats = cache.stats()
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Reruns (session)", st.session_state['perf_reruns'])
+        m2.metric("Taux de succès du cache", f"{stats['hit_rate']:.0%}")
+        m3.metric("Entrées en cache", stats['entries'])
+        st.markdown("**Requêtes les plus lentes**")
+        lentes = perf.slowest_queries(20)
+        if lentes:
+            st.dataframe([
+                {"ms": round(q["ms"], 2), "lignes": q["rows"], "sql": q["sql"],
+                 "plan": " | ".join(q["plan"] or [])}
+                for q in lentes
+            ])
+        st.markdown("**Sections de page**")
+        st.dataframe(perf.section_stats())
+        st.caption(f"Plan capturé au-delà de {perf.SLOW_QUERY_MS:.0f} ms. "
+                   + (f"Export JSON lines : {perf.LOG_FILE}" if perf.LOG_FILE
+                      else "Export désactivé (variable GESTION_PERF_LOG)."))
+
+    st.markdown("---")
+
     st.warning("⚠️ Cette action supprimera TOUTES les données (produits, ventes, achats, dépenses).")
     reset_click = st.button("🧹 Réinitialiser complètement la base de données")
 
@@ -227,4 +500,10 @@ elif page == "Paramètres":
         if confirm_reset:
             db.reset_database(confirm=True)
             st.success("✅ Base de données réinitialisée avec succès !")
-            st.rerun()
\ No newline at end of file
+            st.rerun()
+
+# --- Mesures de la page (non enregistrées si la page s'est interrompue par st.rerun) ---
+perf.record_section(f"page.{page}", page_t0)
+# Premier passage de la session (imports à froid compris pour la première session du processus), puis reruns
+perf.record_section("demarrage.premier_affichage" if st.session_state['perf_reruns'] == 1 else "rerun", run_t0)
+perf.export_pending()
@@ -0,0 +1,150 @@
+# perf.py
+"""
+Instrumentation légère : durée et nombre de lignes de chaque requête SQL, plan d'exécution
+(EXPLAIN QUERY PLAN) des requêtes lentes, durée des sections de page.
+
+Les mesures vont dans des tampons circulaires en mémoire (panneau "Performance" des Paramètres).
+Si la variable d'environnement GESTION_PERF_LOG désigne un fichier, export_pending() y ajoute
+les mesures au format JSON lines (une par ligne) pour suivre les latences dans le temps.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+SLOW_QUERY_MS = float(os.environ.get("GESTION_PERF_SLOW_MS", 50))
+BUFFER_SIZE = 500
+LOG_FILE = os.environ.get("GESTION_PERF_LOG")
+
+queries = deque(maxlen=BUFFER_SIZE)
+sections = deque(maxlen=BUFFER_SIZE)
+
+_pending = deque(maxlen=10 * BUFFER_SIZE)  # en attente d'export (si LOG_FILE)
+_export_lock = threading.Lock()
+
+def _sql_text(sql):
+    return " ".join(sql.split())
+
+def _record(buffer, rec):
+    buffer.append(rec)
+    if LOG_FILE:
+        _pending.append(rec)
+
+class TimedCursor(sqlite3.Cursor):
+    """Curseur qui mesure execute / fetch* et capture le plan des requêtes lentes."""
+
+    _rec = None
+
+    def _start(self, sql, params, many):
+        self._rec = {"type": "query", "ts": time.time(), "sql": _sql_text(sql), "ms": 0.0, "rows": 0,
+                     "many": many, "plan": None}
+        self._params = None if many else params
+        _record(queries, self._rec)
+
+    def _add(self, elapsed, rows=0):
+        rec = self._rec
+        if rec is None:
+            return
+        rec["ms"] += elapsed * 1000
+        rec["rows"] += rows
+        if rec["plan"] is None and rec["ms"] >= SLOW_QUERY_MS and self._params is not None:
+            rec["plan"] = explain(self.connection, rec["sql"], self._params)
+
+    def execute(self, sql, params=()):
+        self._start(sql, params, False)
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        self._add(time.perf_counter() - t0, max(self.rowcount, 0))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._start(sql, None, True)
+        t0 = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._add(time.perf_counter() - t0, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._add(time.perf_counter() - t0, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(time.perf_counter() - t0, len(rows))
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        self._add(time.perf_counter() - t0, len(rows))
+        return rows
+
+class TimedConnection(sqlite3.Connection):
+    """Connexion dont tous les curseurs (y compris execute direct) sont des TimedCursor."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def explain(conn, sql, params=()):
+    """Plan d'exécution (lignes 'detail' d'EXPLAIN QUERY PLAN), ou None si non applicable."""
+    try:
+        cur = sqlite3.Connection.cursor(conn)
+        cur.row_factory = None
+        return [r[3] for r in cur.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    except sqlite3.Error:
+        return None
+
+def record_section(name, t0):
+    """Enregistre la durée d'une section commencée à t0 (time.perf_counter())."""
+    _record(sections, {"type": "section", "ts": time.time(), "name": name,
+                       "ms": (time.perf_counter() - t0) * 1000})
+
+@contextmanager
+def section(name):
+    """Chronomètre une section de page : with perf.section("Tableau de bord.rapport"): ..."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_section(name, t0)
+
+def slowest_queries(n=20):
+    return sorted(list(queries), key=lambda r: r["ms"], reverse=True)[:n]
+
+def section_stats():
+    """Par section : nombre d'exécutions, moyenne et maximum (ms) sur le tampon."""
+    stats = {}
+    for rec in list(sections):
+        s = stats.setdefault(rec["name"], {"section": rec["name"], "n": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["n"] += 1
+        s["total_ms"] += rec["ms"]
+        s["max_ms"] = max(s["max_ms"], rec["ms"])
+    for s in stats.values():
+        s["avg_ms"] = s.pop("total_ms") / s["n"]
+    return sorted(stats.values(), key=lambda s: s["avg_ms"], reverse=True)
+
+def export_pending():
+    """Ajoute au fichier GESTION_PERF_LOG les mesures accumulées depuis le dernier appel."""
+    if not LOG_FILE:
+        return 0
+    with _export_lock:
+        recs = []
+        while _pending:
+            recs.append(_pending.popleft())
+        if recs:
+            with open(LOG_FILE, "a", encoding="utf-8") as f:
+                for rec in recs:
+                    f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+    return len(recs)
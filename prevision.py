@@ -0,0 +1,165 @@
+# prevision.py
+"""
+Prévision des ventes et réapprovisionnement, pour tous les produits à la fois.
+
+Vitesse de vente : lissage exponentiel (ALPHA) des quantités vendues chaque jour, variance lissée de
+l'erreur d'un jour et profil par jour de semaine (ALPHA_SAISON), calculés sur des tableaux NumPy
+(une itération par jour, vectorisée sur les produits). L'état est enregistré dans db.previsions :
+une mise à jour ne lit dans daily_summary que les jours complets pas encore intégrés. Une vente saisie
+après coup sur un jour déjà intégré, ou la reconstruction des résumés, entraîne un recalcul sur les
+HISTORIQUE_JOURS derniers jours (au-delà, le poids des ventes dans le lissage est négligeable).
+
+À partir de l'état et du stock courant :
+    point de commande  demande prévue pendant DELAI_JOURS + stock de sécurité (Z_SERVICE écarts-types)
+    couverture         jours de ventes couverts par le stock à la vitesse actuelle
+    à commander        si le stock est au plus au point de commande : de quoi couvrir
+                       DELAI_JOURS + REVUE_JOURS de demande prévue plus le stock de sécurité
+Les quantités suggérées s'enregistrent comme achats (commander -> db.add_achats_bulk).
+"""
+import os
+from datetime import date
+
+import numpy as np
+
+import cache
+import db
+
+ALPHA = 0.1  # poids du dernier jour dans la vitesse (mémoire d'environ 2 / ALPHA jours)
+ALPHA_SAISON = 0.15  # poids de la dernière semaine dans le profil de chaque jour de semaine
+HISTORIQUE_JOURS = 365  # jours relus lors d'un recalcul complet
+DELAI_JOURS = int(os.environ.get("GESTION_DELAI_REAPPRO", 7))  # délai de réapprovisionnement
+REVUE_JOURS = 7  # la commande couvre aussi la demande jusqu'à la commande suivante
+Z_SERVICE = 1.65  # stock de sécurité : environ 95 % des délais sans rupture
+
+def _jour_semaine(jours):
+    """Numéros de jour -> jour de la semaine (lundi = 0) ; le 1970-01-01 est un jeudi."""
+    return (np.asarray(jours) + 3) % 7
+
+def _etat_vide():
+    return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), np.zeros((0, 7))
+
+def _charger(c):
+    """État enregistré : (ids triés, niveau, variance, saison[n, 7])."""
+    lignes = db.get_previsions(c)
+    if not lignes:
+        return _etat_vide()
+    ids, niveau, variance, saison = zip(*lignes)
+    return (np.array(ids, dtype=np.int64), np.array(niveau), np.array(variance),
+            np.frombuffer(b"".join(saison), dtype=np.float64).reshape(-1, 7).copy())
+
+def _etendre(etat, ids):
+    """Ajoute à l'état les produits de ids qui n'y sont pas encore (niveau, variance et saison à 0)."""
+    anciens, niveau, variance, saison = etat
+    tous = np.union1d(anciens, np.fromiter(ids, dtype=np.int64))
+    if len(tous) == len(anciens):
+        return etat
+    pos = np.searchsorted(tous, anciens)
+    nouveau = (tous, np.zeros(len(tous)), np.zeros(len(tous)), np.zeros((len(tous), 7)))
+    nouveau[1][pos], nouveau[2][pos], nouveau[3][pos] = niveau, variance, saison
+    return nouveau
+
+def _integrer(etat, lignes, debut, fin):
+    """
+    Intègre à etat, en place, les jours debut..fin (numéros de jour) ; lignes : (jour, produit_id, qte)
+    triées par jour (db.get_qte_vendue_par_jour). Un produit sans vente un jour donné compte 0 ce jour-là ;
+    les produits absents de l'état (supprimés) sont ignorés.
+    """
+    ids, niveau, variance, saison = etat
+    t = np.array(lignes, dtype=np.int64).reshape(-1, 3)
+    t = t[np.isin(t[:, 1], ids)]
+    pos = np.searchsorted(ids, t[:, 1])
+    qtes = t[:, 2].astype(np.float64)
+    bornes = np.searchsorted(t[:, 0], np.arange(debut, fin + 2))  # jour debut + i : lignes bornes[i]:bornes[i + 1]
+    q = np.zeros(len(ids))
+    for i, jour in enumerate(range(debut, fin + 1)):
+        q[:] = 0.0
+        q[pos[bornes[i]:bornes[i + 1]]] = qtes[bornes[i]:bornes[i + 1]]
+        erreur = q - niveau
+        variance[:] = (1 - ALPHA) * (variance + ALPHA * erreur ** 2)
+        niveau += ALPHA * erreur
+        w = _jour_semaine(jour)
+        saison[:, w] += ALPHA_SAISON * (q - saison[:, w])
+
+def _lignes(etat):
+    ids, niveau, variance, saison = etat
+    return [(int(i), float(n), float(v), s.tobytes()) for i, n, v, s in zip(ids, niveau, variance, saison)]
+
+def mettre_a_jour(today=None):
+    """
+    Intègre les jours complets (jusqu'à la veille de today) pas encore pris en compte, ou recalcule
+    l'état si l'historique déjà intégré a changé. Retourne le nombre de jours lus (0 : déjà à jour).
+    """
+    hier = db._jour((today or date.today()).isoformat()) - 1
+    with db.lecture_coherente() as c:
+        jour_calcule, jour_modifie = db.get_previsions_etat(c)
+    if jour_calcule is not None and jour_calcule >= hier and jour_modifie is None:
+        return 0
+    with db.transaction(invalidate=False) as c:  # aucune vente ne peut s'intercaler entre lecture et écriture
+        jour_calcule, jour_modifie = db.get_previsions_etat(c)
+        if jour_calcule is None or jour_modifie is not None:
+            etat, debut = _etat_vide(), hier - HISTORIQUE_JOURS + 1
+        else:
+            etat, debut = _charger(c), jour_calcule + 1
+        etat = _etendre(etat, db.get_produit_ids_by_nom().values())
+        if debut <= hier:
+            _integrer(etat, db.get_qte_vendue_par_jour(c, debut, hier), debut, hier)
+        db.save_previsions(c, max(hier, jour_calcule or hier), _lignes(etat))
+    return max(hier - debut + 1, 0)
+
+@cache.cached
+def suggestions(today_str):
+    """
+    Une ligne par produit : vitesse (ventes par jour), demande prévue sur le délai, point de commande,
+    couverture (jours, None sans ventes récentes) et quantité à commander. Produits à commander d'abord,
+    puis par couverture croissante.
+    """
+    mettre_a_jour(date.fromisoformat(today_str))
+    produits = db.get_produits()
+    if not produits:
+        return []
+    pid = np.array([p["id"] for p in produits], dtype=np.int64)
+    stock = np.array([p["stock"] or 0 for p in produits], dtype=np.float64)
+    with db.lecture_coherente() as c:
+        ids, niveau, variance, saison = _etendre(_charger(c), pid)  # produit créé depuis la mise à jour : 0
+    pos = np.searchsorted(ids, pid)
+    vitesse, var, profil = niveau[pos], variance[pos], saison[pos]
+
+    # Facteur de chaque jour de semaine (moyenne 1) ; sans historique, profil plat
+    moyenne = profil.mean(axis=1, keepdims=True)
+    facteurs = np.divide(profil, moyenne, out=np.ones_like(profil), where=moyenne > 0)
+    j0 = db._jour(today_str)
+    demande_delai = vitesse * facteurs[:, _jour_semaine(np.arange(j0, j0 + DELAI_JOURS))].sum(axis=1)
+    demande_cible = vitesse * facteurs[:, _jour_semaine(np.arange(j0, j0 + DELAI_JOURS + REVUE_JOURS))].sum(1)
+    securite = Z_SERVICE * np.sqrt(var * DELAI_JOURS)
+    point_commande = demande_delai + securite
+    a_commander = np.where(stock <= point_commande, np.ceil(np.maximum(demande_cible + securite - stock, 0)), 0)
+    couverture = np.divide(np.maximum(stock, 0), vitesse, out=np.full(len(pid), np.inf), where=vitesse > 1e-6)
+
+    ordre = np.lexsort((couverture, a_commander == 0))
+    return [
+        {"id": int(pid[i]), "nom": produits[i]["nom"], "categorie": produits[i]["categorie"],
+         "stock": int(stock[i]), "vitesse": round(float(vitesse[i]), 2),
+         "demande_delai": round(float(demande_delai[i]), 1), "point_commande": round(float(point_commande[i]), 1),
+         "couverture_jours": None if np.isinf(couverture[i]) else round(float(couverture[i]), 1),
+         "a_commander": int(a_commander[i]), "prix_achat": round(float(produits[i]["prix_achat"] or 0), 2)}
+        for i in ordre
+    ]
+
+def commander(lignes, date_str=None):
+    """
+    Enregistre les quantités à commander de lignes (résultat de suggestions) comme achats au prix
+    d'achat moyen actuel, en une transaction. Retourne le nombre d'achats enregistrés.
+    """
+    achats = [(s["id"], s["a_commander"], s["prix_achat"], date_str) for s in lignes if s["a_commander"] > 0]
+    return db.add_achats_bulk(achats) if achats else 0
+
+if __name__ == "__main__":
+    import sys
+    # python prevision.py : met à jour l'état et affiche les produits à commander
+    db.init_db()
+    print(f"{mettre_a_jour()} jours intégrés.", file=sys.stderr)
+    for s in suggestions(date.today().isoformat()):
+        if not s["a_commander"]:
+            break
+        print(f"{s['nom']} : stock {s['stock']}, {s['vitesse']}/jour, couverture {s['couverture_jours']} j "
+              f"-> commander {s['a_commander']}")
@@ -0,0 +1,131 @@
+# reporting.py
+"""
+Rapports vectorisés (NumPy / pandas) sur des ventes déjà en mémoire.
+
+utils.compute_report lit les agrégats SQL de daily_summary ; ce module traite des DataFrames
+de ventes ligne à ligne (période filtrée, import, analyse) en une seule passe de tableaux :
+filtre de période, CA, coût, classement par produit avec marge et regroupement par
+jour / semaine / mois, sans boucle Python par vente.
+"""
+import numpy as np
+import pandas as pd
+
+import cache
+import db
+
+FREQS = {"D": "Jour", "W": "Semaine", "M": "Mois"}
+
+def _period_keys(days, freq):
+    """days : datetime64[D]. Retourne le début de période (jour, lundi de la semaine, 1er du mois)."""
+    if freq == "D":
+        return days
+    if freq == "W":
+        # 1970-01-01 est un jeudi : (jours + 3) % 7 = rang du jour dans la semaine (lundi = 0)
+        n = days.astype(np.int64)
+        return (n - (n + 3) % 7).astype("datetime64[D]")
+    if freq == "M":
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    raise ValueError(f"Granularité inconnue : {freq!r} (attendu : {', '.join(FREQS)})")
+
+def _lookup(values, pos, default):
+    """values[pos] là où pos >= 0 (résultat de Index.get_indexer), default ailleurs."""
+    out = np.full(len(pos), default, dtype=values.dtype)
+    found = pos >= 0
+    out[found] = values[pos[found]]
+    return out
+
+def compute_report_df(ventes, produits, depenses, from_date, to_date, freq="D"):
+    """
+    ventes   : DataFrame produit_id, quantite, prix_vente_unitaire, date [, cout_unitaire]
+    produits : DataFrame id, nom, prix_achat (coût de repli si cout_unitaire manque)
+    depenses : DataFrame montant, date
+    Retour : même forme que utils.compute_report, avec pour chaque produit de 'top'
+    cout, marge et taux_marge, et 'ca_by_period' [{date, ca, cout, marge}] selon freq (D, W, M).
+    """
+    start = np.datetime64(from_date, "D")
+    end = np.datetime64(to_date, "D")
+
+    days = pd.to_datetime(ventes["date"]).to_numpy().astype("datetime64[D]")
+    mask = (days >= start) & (days <= end)
+    days = days[mask]
+    pid = ventes["produit_id"].to_numpy()[mask]
+    qte = ventes["quantite"].to_numpy(dtype=np.float64)[mask]
+    revenu = qte * ventes["prix_vente_unitaire"].to_numpy(dtype=np.float64)[mask]
+
+    # Coût : cout_unitaire enregistré à la vente, sinon prix_achat courant du produit
+    prod_index = pd.Index(produits["id"].to_numpy())
+    pos = prod_index.get_indexer(pid)
+    prix_achat = _lookup(produits["prix_achat"].to_numpy(dtype=np.float64), pos, 0.0)
+    if "cout_unitaire" in ventes:
+        cout_u = ventes["cout_unitaire"].to_numpy(dtype=np.float64, na_value=np.nan)[mask]
+        cout_u = np.where(np.isnan(cout_u), prix_achat, cout_u)
+    else:
+        cout_u = prix_achat
+    cout = qte * cout_u
+
+    dep_days = pd.to_datetime(depenses["date"]).to_numpy().astype("datetime64[D]")
+    dep_mask = (dep_days >= start) & (dep_days <= end)
+    total_dep = float(depenses["montant"].to_numpy(dtype=np.float64)[dep_mask].sum())
+
+    ca, cout_achat = float(revenu.sum()), float(cout.sum())
+
+    # Par produit
+    codes, uniques = pd.factorize(pid)
+    n = len(uniques)
+    qty_p = np.bincount(codes, weights=qte, minlength=n)
+    rev_p = np.bincount(codes, weights=revenu, minlength=n)
+    cout_p = np.bincount(codes, weights=cout, minlength=n)
+    noms = _lookup(produits["nom"].to_numpy(dtype=object), prod_index.get_indexer(uniques), "—")
+    marge_p = rev_p - cout_p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        taux_p = np.where(rev_p > 0, marge_p / rev_p, 0.0)
+    order = np.argsort(-qty_p, kind="stable")
+    top = [
+        {"produit": noms[i], "qty": int(qty_p[i]), "revenu": float(rev_p[i]),
+         "cout": float(cout_p[i]), "marge": float(marge_p[i]), "taux_marge": float(taux_p[i])}
+        for i in order
+    ]
+
+    # Par période
+    keys, inverse = np.unique(_period_keys(days, freq), return_inverse=True)
+    ca_k = np.bincount(inverse, weights=revenu, minlength=len(keys))
+    cout_k = np.bincount(inverse, weights=cout, minlength=len(keys))
+    ca_by_period = [
+        {"date": str(k), "ca": float(a), "cout": float(b), "marge": float(a - b)}
+        for k, a, b in zip(keys, ca_k, cout_k)
+    ]
+
+    return {
+        "from": from_date,
+        "to": to_date,
+        "ca": ca,
+        "cout_achat": cout_achat,
+        "depenses": total_dep,
+        "profit": ca - cout_achat - total_dep,
+        "top": top,
+        "ca_by_period": ca_by_period,
+        "freq": freq,
+    }
+
+@cache.cached
+def report_from_db(from_date, to_date, freq="D"):
+    """
+    Charge les ventes et dépenses de la période (index sur jour, archives comprises) puis appelle compute_report_df.
+    Les dates sont lues en numéro de jour : conversion vectorisée en datetime64 par db.query_df.
+    Les montants sont lus en centimes entiers et convertis ici en dh float64 : les prix en float32 de
+    query_df (affichage) fausseraient les sommes par rapport aux indicateurs calculés en centimes.
+    """
+    periode = (db._jour(from_date), db._jour(to_date))
+    ventes = db.query_df("""
+        SELECT produit_id, quantite, prix_unitaire_cts, cout_unitaire_cts, jour AS date
+        FROM ventes_hist WHERE jour BETWEEN ? AND ?
+    """, periode)
+    ventes["prix_vente_unitaire"] = ventes.pop("prix_unitaire_cts").to_numpy(dtype=np.float64) / 100
+    ventes["cout_unitaire"] = ventes.pop("cout_unitaire_cts").to_numpy(dtype=np.float64, na_value=np.nan) / 100
+    depenses = db.query_df("SELECT montant_cts / 100.0 AS montant, jour AS date FROM depenses_hist "
+                           "WHERE jour BETWEEN ? AND ?", periode)
+    # Coût de repli arrondi au centime, comme dans daily_summary
+    produits = db.query_df(f"SELECT id, nom, {db._SQL_CTS.format('COALESCE(prix_achat, 0)')} AS prix_achat_cts "
+                           "FROM produits")
+    produits["prix_achat"] = produits.pop("prix_achat_cts").to_numpy(dtype=np.float64) / 100
+    return compute_report_df(ventes, produits, depenses, from_date, to_date, freq)
@@ -0,0 +1,154 @@
+# scheduler.py
+"""
+Calculs en arrière-plan : un thread par processus précalcule les rapports du jour, de la semaine
+et du mois ainsi que la liste des produits sous leur seuil d'alerte (db.resultats_precalcules).
+Le tableau de bord lit ces résultats au lieu de les calculer pendant l'affichage. Le même passage intègre
+les ventes de la veille aux prévisions (prevision.mettre_a_jour).
+
+Recalcul toutes les INTERVAL_S secondes, ou dès qu'une écriture a changé la version des données
+(cache.data_version, vérifiée toutes les POLL_S secondes). Chaque produit qui passe sous son seuil
+donne une alerte, ajoutée à la file `alertes` et au fichier JSON lines ALERT_FILE (si défini).
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import cache
+import db
+import utils
+
+INTERVAL_S = float(os.environ.get("GESTION_SCHEDULER_INTERVAL", 300))
+POLL_S = 2.0
+ALERT_FILE = os.environ.get("GESTION_ALERTES_FILE", "alertes_stock.jsonl")
+
+alertes = queue.Queue(maxsize=1000)  # les plus anciennes sont écartées quand la file est pleine
+
+_lock = threading.Lock()
+_thread = None
+_stop = threading.Event()
+_en_alerte = None  # ids des produits sous le seuil au dernier calcul (None avant le premier)
+_etat = {"calcule_le": None, "ms": None, "erreur": None}
+
+def periodes(today=None):
+    """{"jour" | "semaine" | "mois": (début, fin)} : périodes par défaut du tableau de bord."""
+    today = today or date.today()
+    debut_semaine = today - timedelta(days=today.weekday())
+    debut_mois = today.replace(day=1)
+    fin_mois = (debut_mois.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return {
+        "jour": (today, today),
+        "semaine": (debut_semaine, debut_semaine + timedelta(days=6)),
+        "mois": (debut_mois, fin_mois),
+    }
+
+def _emit_alertes(produits):
+    """Alerte pour chaque produit sous le seuil qui ne l'était pas au calcul précédent."""
+    global _en_alerte
+    if _en_alerte is None:
+        # Premier calcul du processus : on repart de la dernière liste enregistrée
+        prec = db.get_resultat("stock_faible")
+        _en_alerte = {p["id"] for p in prec[0]["produits"]} if prec else set()
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    nouvelles = [{"ts": ts, "produit_id": p["id"], "nom": p["nom"], "categorie": p["categorie"],
+                  "stock": p["stock"], "seuil": p["seuil"]}
+                 for p in produits if p["id"] not in _en_alerte]
+    _en_alerte = {p["id"] for p in produits}
+
+    for alerte in nouvelles:
+        while True:
+            try:
+                alertes.put_nowait(alerte)
+                break
+            except queue.Full:
+                try:
+                    alertes.get_nowait()
+                except queue.Empty:
+                    pass
+    if ALERT_FILE and nouvelles:
+        with open(ALERT_FILE, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(a, ensure_ascii=False) + "\n" for a in nouvelles)
+    return nouvelles
+
+def precompute(today=None):
+    """Calcule et enregistre les rapports par défaut et la liste stock faible. Retourne les nouvelles alertes."""
+    t0 = time.perf_counter()
+    version = cache.data_version()
+    for nom, (debut, fin) in periodes(today).items():
+        rpt = utils.compute_report(debut.strftime("%Y-%m-%d"), fin.strftime("%Y-%m-%d"))
+        db.save_resultat(f"rapport:{nom}", dict(rpt, pid=os.getpid(), version=version))
+
+    produits = [{k: r[k] for k in ("id", "nom", "categorie", "stock", "seuil")}
+                for r in db.get_produits_sous_seuil()]
+    nouvelles = _emit_alertes(produits)
+    db.save_resultat("stock_faible", {"produits": produits, "pid": os.getpid(), "version": version})
+    import prevision  # numpy : chargé par ce thread, pas au démarrage de l'application
+    prevision.mettre_a_jour(today)
+    _etat.update(calcule_le=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 ms=(time.perf_counter() - t0) * 1000, erreur=None)
+    return nouvelles
+
+def _a_jour(contenu):
+    # Calculé par ce processus depuis la dernière écriture (d'ici ou d'un autre processus) : encore exact
+    cache.check_external()  # écritures de api.py : data_version() change avant la comparaison
+    return contenu["pid"] == os.getpid() and contenu["version"] == cache.data_version()
+
+def rapport_precalcule(from_date_str, to_date_str):
+    """Rapport précalculé de cette période s'il est à jour, sinon None (l'appelant calcule lui-même)."""
+    for nom, (debut, fin) in periodes().items():
+        if (debut.strftime("%Y-%m-%d"), fin.strftime("%Y-%m-%d")) == (from_date_str, to_date_str):
+            res = db.get_resultat(f"rapport:{nom}")
+            if res and _a_jour(res[0]):
+                return res[0]
+    return None
+
+def stock_faible_precalcule():
+    """(liste de produits sous le seuil, calcule_le) si le résultat est à jour, sinon None."""
+    res = db.get_resultat("stock_faible")
+    if res and _a_jour(res[0]):
+        return res[0]["produits"], res[1]
+    return None
+
+def _run():
+    version, dernier = None, None
+    while True:
+        cache.check_external()  # les écritures de api.py déclenchent aussi un recalcul
+        if version != cache.data_version() or dernier is None or time.monotonic() - dernier >= INTERVAL_S:
+            version, dernier = cache.data_version(), time.monotonic()
+            try:
+                precompute()
+            except Exception as e:  # le thread ne doit pas mourir : on réessaie au prochain tour
+                _etat["erreur"] = repr(e)
+        if _stop.wait(POLL_S):
+            return
+
+def start():
+    """Démarre le thread (une seule fois par processus ; sans effet s'il tourne déjà)."""
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _stop.clear()
+            _thread = threading.Thread(target=_run, name="gestion-scheduler", daemon=True)
+            _thread.start()
+    return _thread
+
+def stop(timeout=5):
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+def etat():
+    """{actif, calcule_le, ms, erreur} : affiché dans les Paramètres."""
+    return dict(_etat, actif=_thread is not None and _thread.is_alive())
+
+if __name__ == "__main__":
+    import sys
+    # python scheduler.py once : un seul calcul (cron) ; python scheduler.py : boucle au premier plan
+    db.init_db()
+    if sys.argv[1:] == ["once"]:
+        for a in precompute():
+            print(f"⚠️  {a['nom']} : stock {a['stock']} (seuil {a['seuil']})")
+    else:
+        start().join()